@@ -2,9 +2,15 @@ from fastapi import APIRouter
 from .auth import router as auth_router
 from .chat import router as chat_router
 from .user import router as user_router
+from .bootstrap import router as bootstrap_router
+from .metrics import router as metrics_router
+from ..core.config import settings
 
 router = APIRouter()
 
 router.include_router(auth_router, prefix="/auth", tags=["auth"])
 router.include_router(chat_router, prefix="/chat", tags=["chat"])
-router.include_router(user_router, prefix="/user", tags=["user"])
\ No newline at end of file
+router.include_router(user_router, prefix="/user", tags=["user"])
+router.include_router(bootstrap_router, tags=["bootstrap"])
+if settings.METRICS_ENABLED:
+    router.include_router(metrics_router, tags=["metrics"])
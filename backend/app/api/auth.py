@@ -1,16 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Request
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from ..core.config import settings
-from ..core.security import create_access_token, create_refresh_token, verify_token
+from ..core.security import create_access_token, create_refresh_token, verify_token, revoke_token, is_revoked, revoked_users
+from ..core.tickets import tickets
+from ..core.google_auth import google_verifier
 from ..db.session import get_async_db
-from ..db.models import User, AuthProvider, WebSocketToken
+from ..db.models import User, AuthProvider
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
-from uuid import uuid4
+from datetime import datetime
+from typing import Optional
 import logging
 
 logger = logging.getLogger("auth")
@@ -21,12 +21,21 @@ router = APIRouter()
 class AuthRequest(BaseModel):
     token: str
 
-@router.post("/google")
+class AccountResponse(BaseModel):
+    id: int
+    name: Optional[str] = None
+    email: str
+    image_url: Optional[str] = None
+    auth_provider: str
+    created_at: Optional[datetime] = None
+
+class AuthResponse(BaseModel):
+    user: AccountResponse
+
+@router.post("/google", response_model=AuthResponse)
 async def google_auth(request: AuthRequest,response: Response, db: AsyncSession = Depends(get_async_db)):
     try:
-        idinfo = id_token.verify_oauth2_token(
-            request.token, requests.Request(), settings.GOOGLE_CLIENT_ID
-        )
+        idinfo = await google_verifier.verify(request.token)
         
         email = idinfo['email']
         provider_user_id = idinfo['sub']
@@ -39,6 +48,9 @@ async def google_auth(request: AuthRequest,response: Response, db: AsyncSession
             )
         )
         user = user.scalars().first()
+        # The user row stays until the background deletion finishes; no new sessions meanwhile
+        if user and user.id in revoked_users:
+            raise HTTPException(status_code=409, detail="Account deletion in progress")
         
         if not user:
             user = User(
@@ -73,8 +85,17 @@ async def google_auth(request: AuthRequest,response: Response, db: AsyncSession
             max_age=settings.REFRESH_TOKEN_EXPIRE_SECONDS
         )
 
-        return {"user": user}
+        return {"user": {
+            "id": user.id,
+            "name": user.name,
+            "email": user.email,
+            "image_url": user.image_url,
+            "auth_provider": user.auth_provider.value,
+            "created_at": user.created_at
+        }}
         
+    except HTTPException:
+        raise
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid token")
     except Exception as e:
@@ -85,10 +106,12 @@ async def refresh_token(request: Request, response: Response):
     refresh_token = request.cookies.get("refresh_token")
     if not refresh_token:
         raise HTTPException(status_code=401, detail="Refresh token missing")
+    if is_revoked(refresh_token):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
     try:
         payload = jwt.decode(refresh_token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
         user_id = payload.get("sub")
-        if user_id is None:
+        if user_id is None or int(user_id) in revoked_users:
             raise HTTPException(status_code=401, detail="Invalid refresh token")
 
         # Generate new access token
@@ -104,39 +127,28 @@ async def refresh_token(request: Request, response: Response):
             max_age=settings.ACCESS_TOKEN_EXPIRE_SECONDS
         )
         return {"detail": "Access token refreshed"}
-    except JWTError:
+    except HTTPException:
+        raise
+    except (JWTError, ValueError):
         raise HTTPException(status_code=401, detail="Invalid refresh token")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @router.post("/logout")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
     try:
+        # Deleting the cookies is up to the browser; denylist the tokens so copies stop working too
+        for cookie in ("access_token", "refresh_token"):
+            token = request.cookies.get(cookie)
+            if token:
+                revoke_token(token)
         response.delete_cookie("access_token")
         response.delete_cookie("refresh_token")
         return {"detail": "Logged out"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-ws_tokens = {}
-
 @router.post("/ws-token")
-async def generate_ws_token(
-    db: AsyncSession = Depends(get_async_db),
-    user_id: int = Depends(verify_token)
-):
-    try:
-        token = str(uuid4())
-        expires_at = datetime.utcnow() + timedelta(minutes=5)  # Token valid for 5 minutes
-        ws_token = WebSocketToken(
-            token=token,
-            user_id=user_id,
-            expires_at=expires_at
-        )
-        db.add(ws_token)
-        await db.commit()
-        logger.info(f"Generated ws_token for user_id={user_id}: {token}")
-        return {"ws_token": token}
-    except Exception as e:
-        logger.error(f"Failed to generate ws_token: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+async def generate_ws_token(user_id: int = Depends(verify_token)):
+    # Signed and checked in memory, so reconnects never touch the database
+    return {"ws_token": tickets.issue(user_id)}
@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from ..db.session import AsyncReadSessionLocal
+from ..core.security import verify_token
+from ..core.tickets import tickets
+from .chat import list_threads, list_messages, ThreadSummaryResponse, MessageResponse
+from .user import load_profile, UserResponse
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+
+router = APIRouter()
+
+class BootstrapResponse(BaseModel):
+    user: UserResponse
+    threads: List[ThreadSummaryResponse]
+    threads_next_cursor: Optional[str] = None
+    thread_id: Optional[int] = None
+    messages: List[MessageResponse]
+    messages_next_cursor: Optional[str] = None
+    ws_token: str
+
+@router.get("/bootstrap", response_model=BootstrapResponse)
+async def bootstrap(
+    threads_limit: int = Query(50, ge=1, le=200),
+    messages_limit: int = Query(50, ge=1, le=200),
+    user_id: int = Depends(verify_token)
+):
+    """Everything the app needs on first load, in one round trip.
+
+    The profile and the thread list are read concurrently, each on its own
+    pooled read connection; the latest messages of the most recently active
+    thread follow on the thread list's connection. Includes a WebSocket ticket.
+    """
+    async def profile():
+        async with AsyncReadSessionLocal() as db:
+            return await load_profile(db, user_id)
+
+    async def threads():
+        async with AsyncReadSessionLocal() as db:
+            threads, next_cursor = await list_threads(db, user_id, threads_limit)
+            messages, messages_cursor = [], None
+            if threads:
+                messages, messages_cursor = await list_messages(db, threads[0]["id"], messages_limit)
+            return threads, next_cursor, messages, messages_cursor
+
+    try:
+        user, (threads, next_cursor, messages, messages_cursor) = await asyncio.gather(profile(), threads())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return {
+        "user": user,
+        "threads": threads,
+        "threads_next_cursor": next_cursor,
+        "thread_id": threads[0]["id"] if threads else None,
+        "messages": messages,
+        "messages_next_cursor": messages_cursor,
+        "ws_token": tickets.issue(user_id)
+    }
@@ -1,48 +1,215 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-from ..db.session import get_async_db
-from ..db.models import Thread, Message, WebSocketToken
-from ..core.security import verify_token
-from ..core.websocket import manager, WebSocket, WebSocketDisconnect
-from ..core.gemini_client import get_gemini_response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from typing import List, Optional
+from ..db.session import get_async_db, get_async_read_db, AsyncReadSessionLocal, async_engine, is_sqlite
+from ..db import fts
+from ..db.models import Thread, Message, ThreadActivity, UserStats
+from ..db.writer import message_writer
+from ..core.security import verify_token, decode_token, revoked_users
+from ..core.websocket import manager
+from ..core.llm_cache import cached_gemini_stream
+from ..core.dispatcher import ThreadDispatcher
+from ..core.context import context_builder
+from ..core.retrieval import retrieval_index
+from ..core.admission import admission, RateLimited
+from ..core.tickets import tickets, TicketError
+from ..core.config import settings
+from ..core import metrics, tracing
 from datetime import datetime
-from sqlalchemy import select
+from sqlalchemy import String, cast, delete, literal, select, func, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-import traceback
+from functools import partial
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+import argparse
+import asyncio
+import logging
+import orjson
+import time
 
 
+logger = logging.getLogger("chat")
+
 router = APIRouter()
 
 class ThreadCreateRequest(BaseModel):
     title: str
 
-@router.post("/threads")
+class ThreadResponse(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+
+class ThreadSummaryResponse(ThreadResponse):
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
+    last_activity_at: datetime
+
+class MessageResponse(BaseModel):
+    id: int
+    thread_id: int
+    content: str
+    is_bot: bool
+    created_at: Optional[datetime] = None
+
+class SearchResultResponse(BaseModel):
+    message_id: int
+    thread_id: int
+    thread_title: str
+    is_bot: bool
+    created_at: Optional[datetime] = None
+    snippet: str
+    rank: float
+
+@router.post("/threads", response_model=ThreadResponse)
 async def create_thread(request: ThreadCreateRequest, user_id: int = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
     try:
         thread = Thread(user_id=user_id, title=request.title)
         db.add(thread)
         await db.commit()
         await db.refresh(thread)
-        return thread
+        return {"id": thread.id, "title": thread.title, "created_at": thread.created_at}
     except Exception as e:
-        print(e)
+        logger.error(f"Failed to create thread: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/threads")
-async def get_threads(user_id: int = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+def _encode_cursor(position, thread_id: int) -> str:
+    # `position` is the sort timestamp as stored: its text on SQLite, a datetime elsewhere
+    position = position if isinstance(position, str) else position.isoformat()
+    return urlsafe_b64encode(f"{position}|{thread_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        position, thread_id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        datetime.fromisoformat(position)
+        return position, int(thread_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+def _thread_queries(user_id: int):
+    """The page query, its (timestamp, id) sort key, and the query whose row identifies the list."""
+    if not is_sqlite():
+        # The summary triggers are SQLite-only; elsewhere list by creation time without previews
+        query = select(
+            Thread.id, Thread.title, Thread.created_at, Thread.created_at.label("last_activity_at")
+        ).filter(Thread.user_id == user_id)
+        sort_key = (Thread.created_at, Thread.id)
+        etag_query = select(func.count(Thread.id), func.max(Thread.id)).filter(Thread.user_id == user_id)
+        return query, sort_key, etag_query
+
+    query = select(
+        Thread.id, Thread.title, Thread.created_at,
+        ThreadActivity.message_count, ThreadActivity.last_message_at,
+        ThreadActivity.last_message_preview, ThreadActivity.last_activity_at
+    ).join(Thread, Thread.id == ThreadActivity.thread_id).filter(ThreadActivity.user_id == user_id)
+    sort_key = (ThreadActivity.last_activity_at, ThreadActivity.thread_id)
+    # Any new thread or message moves the newest activity row, so it identifies the list
+    etag_query = select(
+        select(UserStats.thread_count).filter(UserStats.user_id == user_id).scalar_subquery(),
+        ThreadActivity.thread_id,
+        ThreadActivity.last_message_id
+    ).filter(ThreadActivity.user_id == user_id).order_by(
+        ThreadActivity.last_activity_at.desc(), ThreadActivity.thread_id.desc()
+    ).limit(1)
+    return query, sort_key, etag_query
+
+async def list_threads(db: AsyncSession, user_id: int, limit: int, after=None):
+    """A page of threads, most recently active first, and the cursor for the next page."""
+    query, sort_key, _ = _thread_queries(user_id)
+    if is_sqlite():
+        # SQLite keeps timestamps as text and orders them as text, and CURRENT_TIMESTAMP
+        # defaults leave out the microseconds; the cursor carries the stored text so it
+        # compares exactly as ORDER BY does
+        query = query.add_columns(cast(sort_key[0], String).label("position"))
+        if after:
+            query = query.filter(tuple_(*sort_key) < tuple_(literal(after[0], String), after[1]))
+    else:
+        query = query.add_columns(sort_key[0].label("position"))
+        if after:
+            query = query.filter(tuple_(*sort_key) < (datetime.fromisoformat(after[0]), after[1]))
+    query = query.order_by(sort_key[0].desc(), sort_key[1].desc()).limit(limit + 1)
+    threads = [dict(row._mapping) for row in await db.execute(query)]
+    cursor = _encode_cursor(threads[limit - 1]["position"], threads[limit - 1]["id"]) if len(threads) > limit else None
+    for thread in threads:
+        del thread["position"]
+    return threads[:limit], cursor
+
+async def list_messages(db: AsyncSession, thread_id: int, limit: int, before_id: Optional[int] = None, since_id: Optional[int] = None):
+    """A page of a thread's messages in chronological order, and the cursor described in get_messages."""
+    query = select(
+        Message.id, Message.thread_id, Message.content, Message.is_bot, Message.created_at
+    ).filter(Message.thread_id == thread_id)
+    if since_id is not None:
+        query = query.filter(Message.id > since_id).order_by(Message.id.asc())
+    else:
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        query = query.order_by(Message.id.desc())
+    messages = [dict(row._mapping) for row in await db.execute(query.limit(limit + 1))]
+
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if since_id is None:
+        messages.reverse()
+    if has_more:
+        return messages, str(messages[-1]["id"] if since_id is not None else messages[0]["id"])
+    return messages, None
+
+@router.get("/threads", response_model=List[ThreadSummaryResponse])
+async def get_threads(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Most recently active threads first, with message count and last-message preview.
+
+    Reads the trigger-maintained thread_activity table along its
+    (user_id, last_activity_at, thread_id) index, so a page is one indexed
+    query. Pass the X-Next-Cursor header of a page as `cursor` to get the next one.
+    """
+    after = _decode_cursor(cursor) if cursor else None
     try:
-        threads = await db.execute(select(Thread).filter(Thread.user_id == user_id))
-        return threads.scalars().all()
+        _, _, etag_query = _thread_queries(user_id)
+        latest = (await db.execute(etag_query)).first()
+        etag = f'W/"t-{user_id}-{"-".join(map(str, latest or ()))}-{limit}-{cursor}"'
+        not_modified = _not_modified(request, etag)
+        if not_modified:
+            return not_modified
+
+        threads, next_cursor = await list_threads(db, user_id, limit, after)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return threads
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/threads/{thread_id}/messages")
+@router.get("/threads/{thread_id}/messages", response_model=List[MessageResponse])
 async def get_messages(
     thread_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = None,
+    since_id: Optional[int] = None,
     user_id: int = Depends(verify_token),
-    db: AsyncSession = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
+    """Messages in chronological order, paginated on (thread_id, id).
+
+    By default the latest `limit` messages are returned; X-Next-Cursor holds the
+    `before_id` for the previous page. With `since_id` only newer messages are
+    returned and X-Next-Cursor holds the `since_id` for the next delta fetch.
+    """
     thread = await db.execute(select(Thread).filter(
         Thread.id == thread_id,
         Thread.user_id == user_id
@@ -51,111 +218,390 @@ async def get_messages(
     
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
-        
-    messages = await db.execute(select(Message).filter(Message.thread_id == thread_id))
-    return messages.scalars().all()
 
-@router.websocket("/ws/{ws_token}")
-async def websocket_endpoint(websocket: WebSocket, ws_token: str, db: AsyncSession = Depends(get_async_db)):
-    # Log connection attempt
-    print(f"WebSocket connection attempt with token: {ws_token}")
+    # Messages are append-only, so the newest id identifies the thread's state
+    max_id = (await db.execute(
+        select(func.max(Message.id)).filter(Message.thread_id == thread_id)
+    )).scalar()
+    etag = f'W/"m-{thread_id}-{max_id}-{limit}-{before_id}-{since_id}"'
+    not_modified = _not_modified(request, etag)
+    if not_modified:
+        return not_modified
+
+    messages, next_cursor = await list_messages(db, thread_id, limit, before_id, since_id)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return messages
+
+@router.get("/search", response_model=List[SearchResultResponse])
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    user_id: int = Depends(verify_token),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Search the caller's messages, best bm25 match first.
+
+    Terms are ANDed and matched after stemming; end a term with * for a
+    prefix match. Matches in `snippet` are wrapped in **.
+    """
+    if not is_sqlite():
+        raise HTTPException(status_code=501, detail="Search requires the SQLite FTS5 index")
+    try:
+        return await fts.search(db, user_id, q, limit, offset)
+    except Exception as e:
+        logger.error(f"Search failed: {e}")
+        raise HTTPException(status_code=500, detail="Search failed")
+
+async def process_message(websocket: WebSocket, user_id: int, data: dict):
+    # Validate thread ownership; the session is closed again before the LLM call
+    with tracing.span("validate"):
+        async with AsyncReadSessionLocal() as db:
+            thread = await db.execute(select(Thread.id).filter(
+                Thread.id == data["thread_id"],
+                Thread.user_id == user_id
+            ))
+            thread = thread.first()
+
+    if not thread:
+        tracing.annotate(outcome="thread_not_found")
+        manager.send(websocket, user_id, {
+            "type": "error",
+            "thread_id": data["thread_id"],
+            "message": "Thread not found"
+        })
+        return
+
+    # Turn away an over-budget or overloaded request before anything is saved, so no message is left without a reply
+    try:
+        admission.check(user_id)
+    except RateLimited as e:
+        tracing.annotate(outcome="rate_limited")
+        manager.send(websocket, user_id, {
+            "type": "error",
+            "thread_id": data["thread_id"],
+            "message": str(e),
+            "retry_after": e.retry_after
+        })
+        return
+
+    # The account may have been deleted while this frame was queued
+    if user_id in revoked_users:
+        tracing.annotate(outcome="revoked")
+        return
+
+    # Save user message
+    with tracing.span("persist_user"):
+        message_id = await message_writer.save(data["thread_id"], data["content"], is_bot=False)
+    context_builder.add(data["thread_id"], message_id, False, data["content"])
+    retrieval_index.add(user_id, data["thread_id"], message_id, data["content"])
+
+    # Send acknowledgment
+    with tracing.span("broadcast"):
+        await manager.broadcast_to_user({
+            "type": "message",
+            "thread_id": data["thread_id"],
+            "message_id": message_id,
+            "content": data["content"],
+            "is_bot": False,
+            "timestamp": datetime.utcnow().isoformat()
+        }, user_id)
     
-    result = await db.execute(
-        select(WebSocketToken).filter(
-            WebSocketToken.token == ws_token,
-            WebSocketToken.expires_at > datetime.utcnow()
+    # Stream the bot response, then save it
+    try:
+        chunks = []
+        ttft_ms = None
+        started = time.perf_counter()
+        with tracing.span("context"):
+            contents = await context_builder.build(data["thread_id"])
+        if settings.RETRIEVAL_ENABLED:
+            # Related turns from the user's other threads
+            with tracing.span("recall"):
+                contents = await retrieval_index.ground(user_id, data["thread_id"], data["content"], contents)
+        with tracing.span("llm"):
+            async for chunk in cached_gemini_stream(
+                contents,
+                use_cache=data.get("cache", True),
+                user_id=user_id,
+                on_queue_position=lambda position: manager.send(websocket, user_id, {
+                    "type": "queue_position",
+                    "thread_id": data["thread_id"],
+                    "reply_to": message_id,
+                    "position": position
+                })
+            ):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                    tracing.annotate(ttft_ms=ttft_ms)
+                chunks.append(chunk)
+                with tracing.span("broadcast"):
+                    await manager.broadcast_to_user({
+                        "type": "message_delta",
+                        "thread_id": data["thread_id"],
+                        "reply_to": message_id,
+                        "delta": chunk
+                    }, user_id)
+
+        bot_response = "".join(chunks)
+        if user_id in revoked_users:
+            tracing.annotate(outcome="revoked")
+            return
+        with tracing.span("persist_bot"):
+            bot_message_id = await message_writer.save(data["thread_id"], bot_response, is_bot=True)
+        context_builder.add(data["thread_id"], bot_message_id, True, bot_response)
+        retrieval_index.add(user_id, data["thread_id"], bot_message_id, bot_response)
+        
+        with tracing.span("broadcast"):
+            await manager.broadcast_to_user({
+                "type": "message_complete",
+                "thread_id": data["thread_id"],
+                "reply_to": message_id,
+                "message_id": bot_message_id,
+                "content": bot_response,
+                "is_bot": True,
+                "timestamp": datetime.utcnow().isoformat(),
+                "ttft_ms": ttft_ms
+            }, user_id)
+        tracing.annotate(outcome="ok")
+    except asyncio.CancelledError:
+        tracing.annotate(outcome="cancelled")
+        await manager.broadcast_to_user({
+            "type": "message_cancelled",
+            "thread_id": data["thread_id"],
+            "reply_to": message_id
+        }, user_id)
+        raise
+    except RateLimited as e:
+        # check() passed, but a concurrent turn took the budget or queue room before the slot was acquired
+        tracing.annotate(outcome="rate_limited")
+        retracted = not chunks
+        if retracted:
+            await retract_message(data["thread_id"], message_id)
+        await manager.broadcast_to_user({
+            "type": "error",
+            "thread_id": data["thread_id"],
+            "reply_to": message_id,
+            "retracted": retracted,
+            "message": str(e),
+            "retry_after": e.retry_after
+        }, user_id)
+    except Exception:
+        tracing.annotate(outcome="error")
+        logger.exception(f"Failed to get bot response for thread {data['thread_id']}")
+        await manager.broadcast_to_user({
+            "type": "error",
+            "thread_id": data["thread_id"],
+            "message": "Failed to get bot response"
+        }, user_id)
+
+async def retract_message(thread_id: int, message_id: int):
+    """Delete a user message that will get no reply, so the thread does not keep an unanswered turn."""
+    async with async_engine.begin() as conn:
+        await conn.execute(delete(Message).filter(Message.id == message_id))
+    context_builder.discard(thread_id, message_id)
+    # The retrieval index may keep its vector; recall skips ids that are gone from `messages`
+
+async def handle_frame(websocket: WebSocket, user_id: int, data: dict):
+    """Process a chat frame and close the trace its receive loop started."""
+    try:
+        await process_message(websocket, user_id, data)
+    finally:
+        trace = tracing.current_trace.get()
+        if trace is not None:
+            trace.finish()
+
+async def load_missed_messages(user_id: int, after_id: int) -> List[dict]:
+    """Messages in any of the user's threads newer than `after_id`, as `message` frames."""
+    async with AsyncReadSessionLocal() as db:
+        rows = await db.execute(
+            select(Message.id, Message.thread_id, Message.content, Message.is_bot, Message.created_at)
+            .join(Thread, Thread.id == Message.thread_id)
+            .filter(Thread.user_id == user_id, Message.id > after_id)
+            .order_by(Message.id.asc())
+            .limit(settings.WS_RESUME_DB_LIMIT)
         )
-    )
-    ws_token_entry = result.scalars().first()
+        return [
+            {
+                "type": "message",
+                "thread_id": row.thread_id,
+                "message_id": row.id,
+                "content": row.content,
+                "is_bot": row.is_bot,
+                "timestamp": row.created_at.isoformat() if row.created_at else None
+            }
+            for row in rows
+        ]
 
-    if not ws_token_entry:
-        print("Invalid WebSocket token", ws_token, ws_token_entry.to_dict())
+@router.websocket("/ws/{ws_token}")
+async def websocket_endpoint(
+    websocket: WebSocket,
+    ws_token: str,
+    epoch: Optional[str] = None,
+    last_seq: Optional[int] = None,
+    last_message_id: Optional[int] = None
+):
+    """Chat socket. A reconnecting client passes the `epoch` and `last_seq` of its
+    last `session`, plus the newest `last_message_id` it has, to get what it missed."""
+    try:
+        user_id = await tickets.redeem(ws_token)
+        if user_id in revoked_users:
+            raise TicketError("Account deleted")
+    except TicketError as e:
+        logger.info(f"Rejected WebSocket ticket: {e}")
         await websocket.close(code=1008)  # Policy Violation
         return
 
-    user_id = ws_token_entry.user_id
+    # When the session cookie comes along with the handshake, a revoked or foreign session cannot connect
+    access_token = websocket.cookies.get("access_token")
+    if access_token:
+        try:
+            if decode_token(access_token) != user_id:
+                raise HTTPException(status_code=401, detail="Ticket does not match session")
+        except HTTPException as e:
+            logger.info(f"Rejected WebSocket session: {e.detail}")
+            await websocket.close(code=1008)
+            return
 
-    # Optionally delete the token to prevent reuse
-    await db.delete(ws_token_entry)
-    await db.commit()
+    resume = None
+    if last_seq is not None or last_message_id is not None:
+        resume = {"epoch": epoch, "last_seq": last_seq or 0}
+    await manager.connect(
+        websocket,
+        user_id,
+        resume=resume,
+        load_missed=partial(load_missed_messages, user_id, last_message_id) if last_message_id is not None else None
+    )
 
-    await manager.connect(websocket, user_id)
+    # The receive loop only routes frames; processing happens in per-thread workers
+    dispatcher = ThreadDispatcher(
+        partial(handle_frame, websocket, user_id),
+        max_inflight=settings.WS_MAX_INFLIGHT_PER_CONNECTION
+    )
 
     try:
         while True:
-            data = await websocket.receive_json()
-            
-            print(data)
-            
-            if data.get("type") == "pong":
+            text = await websocket.receive_text()
+            metrics.ws_frames_received.inc()
+            received = time.perf_counter()
+            try:
+                data = orjson.loads(text)
+            except orjson.JSONDecodeError:
+                data = None
+            parsed = time.perf_counter()
+            manager.touch(websocket, user_id)
+            if not isinstance(data, dict):
+                manager.send(websocket, user_id, {
+                    "type": "error",
+                    "message": "Frames must be JSON objects"
+                })
                 continue
             
-            # Validate thread ownership
-            thread = await db.execute(select(Thread).filter(
-                Thread.id == data["thread_id"],
-                Thread.user_id == user_id
-            ))
-            thread = thread.scalars().first()
-            
-            if not thread:
-                await websocket.send_json({
+            frame_type = data.get("type")
+            if frame_type == "pong":
+                continue
+
+            thread_id = data.get("thread_id")
+            if thread_id is None:
+                manager.send(websocket, user_id, {
                     "type": "error",
-                    "message": "Thread not found"
+                    "message": "thread_id is required"
                 })
                 continue
-            
-            # Save user message
-            message = Message(
-                thread_id=data["thread_id"],
-                content=data["content"],
-                is_bot=False
-            )
-            db.add(message)
-            await db.commit()
-            
-            await db.refresh(message)
-            
-            # Send acknowledgment
-            await manager.broadcast_to_user({
-                "type": "message",
-                "thread_id": data["thread_id"],
-                "message_id": message.id,
-                "content": data["content"],
-                "is_bot": False,
-                "timestamp": datetime.utcnow().isoformat()
-            }, user_id)
-            
-            # Get and save bot response
-            try:
-                bot_response = await get_gemini_response(data["content"])
-                bot_message = Message(
-                    thread_id=data["thread_id"],
-                    content=bot_response,
-                    is_bot=True
-                )
-                db.add(bot_message)
-                await db.commit()
-
-                await db.refresh(bot_message)
-                
-                await manager.broadcast_to_user({
-                    "type": "message",
-                    "thread_id": data["thread_id"],
-                    "message_id": bot_message.id,
-                    "content": bot_response,
-                    "is_bot": True,
-                    "timestamp": datetime.utcnow().isoformat()
-                }, user_id)
-            except Exception as e:
-                await manager.broadcast_to_user({
+
+            if frame_type == "cancel":
+                dispatcher.cancel(thread_id)
+                continue
+
+            content = data.get("content")
+            if not isinstance(content, str) or not content.strip():
+                manager.send(websocket, user_id, {
+                    "type": "error",
+                    "thread_id": thread_id,
+                    "message": "content is required"
+                })
+                continue
+
+            # Only frames handed to a worker are traced; the dispatcher carries the trace to that worker
+            trace = tracing.start_trace("chat_frame", started=received, user_id=user_id, thread_id=thread_id)
+            trace.record("receive", received, parsed)
+            if not dispatcher.submit(thread_id, data):
+                manager.send(websocket, user_id, {
                     "type": "error",
-                    "message": "Failed to get bot response"
-                }, user_id)
+                    "thread_id": thread_id,
+                    "message": "Too many messages in flight"
+                })
             
     except WebSocketDisconnect:
+        pass
+
+    except Exception:
+        logger.exception(f"WebSocket for user {user_id} failed")
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+    finally:
         await manager.disconnect(websocket, user_id)
-        
-    except Exception as e:
-        print(e)
-        print(traceback.format_exc())
-        await websocket.close()
+        # A deleted account's replies are dropped rather than saved behind the deletion
+        await dispatcher.close(cancel=user_id in revoked_users)
+
+def bench(messages: int, rounds: int):
+    """Time serializing a page of `messages` messages as FastAPI does, before and after the typed schemas."""
+    import json
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+
+    now = datetime.utcnow()
+    rows = [
+        {"id": i, "thread_id": 1, "content": f"message {i} " + "lorem ipsum dolor sit amet " * 6, "is_bot": i % 2 == 1, "created_at": now}
+        for i in range(1, messages + 1)
+    ]
+    entities = [Message(**row) for row in rows]
+    field = create_model_field(name="response", type_=List[MessageResponse], mode="serialization")
+
+    async def typed(response_class):
+        return response_class(await serialize_response(field=field, response_content=rows)).body
+
+    cases = [
+        # What get_messages did before: ORM entities, no response model, stdlib json
+        ("ORM rows, jsonable_encoder, JSONResponse", lambda: asyncio.sleep(0, JSONResponse(jsonable_encoder(entities)).body)),
+        ("column rows, response model, JSONResponse", lambda: typed(JSONResponse)),
+        ("column rows, response model, ORJSONResponse", lambda: typed(ORJSONResponse)),
+    ]
+
+    async def run():
+        for label, render in cases:
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                body = await render()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f"{label:<46} p50 {timings[len(timings) // 2]:7.1f}ms  max {timings[-1]:7.1f}ms  {len(body) / 1e6:.2f} MB")
+
+    asyncio.run(run())
+
+    frame = {"type": "message_delta", "thread_id": 1, "reply_to": 2, "delta": "lorem ipsum ", "seq": 1234}
+    for label, encode in [("json.dumps", lambda: json.dumps(frame).encode()), ("orjson.dumps", lambda: orjson.dumps(frame))]:
+        started = time.perf_counter()
+        for _ in range(100000):
+            encode()
+        print(f"delta frame, {label:<33} {(time.perf_counter() - started) * 10:.2f}us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat API")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="time response serialization for a large message list")
+    bench_parser.add_argument("--messages", type=int, default=10000)
+    bench_parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    bench(args.messages, args.rounds)
+
+if __name__ == "__main__":
+    main()
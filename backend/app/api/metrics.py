@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Response
+from ..core.metrics import registry
+from ..core.admission import admission
+from ..core.llm_cache import response_cache
+from ..core.websocket import manager
+from ..core.tickets import tickets
+from ..core.security import token_cache
+from ..core.google_auth import google_verifier
+from ..core.retrieval import retrieval_index
+from ..core import logs
+from ..db.writer import message_writer
+from ..db.deletion import account_deleter
+from ..db.session import async_engine, async_read_engine
+
+router = APIRouter()
+
+def _pool(engine) -> dict:
+    return {"size": engine.pool.size(), "checked_out": engine.pool.checkedout()}
+
+# Counters the services already keep, read on each scrape
+registry.collect("llm_admission", admission.stats)
+registry.collect("llm_cache", response_cache.stats)
+registry.collect("message_writer", message_writer.stats)
+registry.collect("account_deletion", account_deleter.stats)
+registry.collect("websocket", manager.stats)
+registry.collect("backplane", manager.backplane.stats)
+registry.collect("ws_tickets", tickets.stats)
+registry.collect("auth_cache", token_cache.stats)
+registry.collect("google_auth", google_verifier.stats)
+registry.collect("retrieval", retrieval_index.stats)
+registry.collect("logging", lambda: logs.handler.stats() if logs.handler else {})
+registry.collect("db_write_pool", lambda: _pool(async_engine))
+registry.collect("db_read_pool", lambda: _pool(async_read_engine))
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of every metric in the registry."""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,10 +1,15 @@
 # app/api/user.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from ..db.session import get_async_db
-from ..db.models import User, Thread
-from ..core.security import verify_token
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db.session import get_async_read_db, is_sqlite
+from ..db.models import User, Thread, UserStats
+from ..core.security import verify_token, revoke_token
+from ..core.retrieval import retrieval_index
+from ..core.websocket import manager
+from ..db.deletion import account_deleter
+from ..db.portability import export_ndjson, import_ndjson, ImportFormatError
 from pydantic import BaseModel
 from sqlalchemy import select, func
 
@@ -16,7 +21,7 @@ class UserResponse(BaseModel):
     auth_provider: str
     threads_count: int
     name: str
-    image_url: str
+    image_url: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -26,37 +31,68 @@ class UserProfile(BaseModel):
     auth_provider: str
     provider_user_id: str
 
+async def load_profile(db: AsyncSession, user_id: int) -> Optional[dict]:
+    user = await db.execute(select(User).filter(User.id == user_id))
+    user = user.scalars().first()
+    if not user:
+        return None
+
+    # Get threads count; SQLite keeps it in user_stats, elsewhere count the rows
+    if is_sqlite():
+        threads_count = await db.execute(select(UserStats.thread_count).filter(UserStats.user_id == user_id))
+    else:
+        threads_count = await db.execute(select(func.count(Thread.id)).filter(Thread.user_id == user_id))
+    threads_count = threads_count.scalar() or 0
+
+    return {
+        "id": user.id,
+        "email": user.email,
+        "name": user.name,
+        "auth_provider": user.auth_provider.value,
+        "threads_count": threads_count,
+        "image_url": user.image_url
+    }
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user(
     user_id: int = Depends(verify_token),
-    db: Session = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     try:
-        # print(user_id)
-        user = await db.execute(select(User).filter(User.id == user_id))
-        user = user.scalars().first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get threads count
-        threads_count = await db.execute(select(func.count(Thread.id)).filter(Thread.user_id == user_id))
-
-        if threads_count:
-            threads_count = threads_count.scalar()
-        else:
-            threads_count = 0
-        
-        return {
-            "id": user.id,
-            "email": user.email,
-            "name": user.name,
-            "auth_provider": user.auth_provider.value,
-            "threads_count": threads_count,
-            "image_url": user.image_url
-        }
-    
+        profile = await load_profile(db, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not profile:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
+
+@router.get("/me/export")
+async def export_account(user_id: int = Depends(verify_token)):
+    """Stream all of the caller's threads and messages as NDJSON, in constant memory."""
+    return StreamingResponse(
+        export_ndjson(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-export-{user_id}.ndjson"'}
+    )
+
+class ImportResponse(BaseModel):
+    threads: int
+    messages: int
+
+@router.post("/me/import", response_model=ImportResponse)
+async def import_account(request: Request, user_id: int = Depends(verify_token)):
+    """Add the threads and messages of an NDJSON export (the request body) to the caller's account.
+
+    Messages are committed in batches, so a body that turns out to be
+    invalid part way through leaves the batches before the error in place.
+    """
+    try:
+        return await import_ndjson(user_id, request.stream())
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # Rebuilt on the next turn, with the imported messages
+        retrieval_index.forget(user_id)
 
 # @router.get("/me/threads")
 # async def get_user_threads(
@@ -66,19 +102,27 @@ async def get_current_user(
 #     threads = await db.execute(select(Thread).filter(Thread.user_id == user_id))
 #     return threads.scalars().all()
 
-@router.delete("/me")
+@router.delete("/me", status_code=202)
 async def delete_account(
+    request: Request,
+    response: Response,
     user_id: int = Depends(verify_token),
-    db: Session = Depends(get_async_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
+    """Revoke the account at once and delete its data in the background (see AccountDeleter)."""
+    user = await db.execute(select(User.id).filter(User.id == user_id))
+    if user.first() is None:
+        raise HTTPException(status_code=404, detail="User not found")
     try:
-        user = await db.execute(select(User).filter(User.id == user_id))
-        user = user.scalars().first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        await db.delete(user)
-        await db.commit()
-        return {"message": "Account deleted successfully"}
+        await account_deleter.request(user_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    for cookie in ("access_token", "refresh_token"):
+        token = request.cookies.get(cookie)
+        if token:
+            revoke_token(token)
+        response.delete_cookie(cookie)
+    await manager.close_user(user_id)
+    retrieval_index.forget(user_id)
+    return {"message": "Account deletion started"}
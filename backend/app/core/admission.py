@@ -0,0 +1,232 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+from .config import settings
+
+PositionCallback = Callable[[int], None]
+
+
+class RateLimited(Exception):
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available, 0 if one is; takes nothing."""
+        self.refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> float:
+        """Take one token; returns 0 on success or the seconds until one is available."""
+        retry_after = self.wait_time()
+        if not retry_after:
+            self.tokens -= 1
+        return retry_after
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class _Waiter:
+    def __init__(self, future: asyncio.Future, on_position: Optional[PositionCallback]):
+        self.future = future
+        self.on_position = on_position
+        self.position = 0
+
+
+class AdmissionScheduler:
+    """Admission control in front of upstream LLM calls.
+
+    At most `max_concurrency` calls run at once. Each user has a token bucket
+    (`rate` calls per second, up to `burst` at once), and requests beyond it
+    are rejected with RateLimited. Requests that have to wait are queued per
+    user and granted round-robin across users, so one heavy user cannot push
+    everyone else to the back. Waiters are told their position whenever it
+    changes. Calls without a user_id (background work) skip the bucket.
+    """
+
+    def __init__(self, max_concurrency: int, rate: float, burst: float, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self._queues: "OrderedDict[Optional[int], Deque[_Waiter]]" = OrderedDict()
+        self._buckets: Dict[int, TokenBucket] = {}
+        self.admitted = 0
+        self.rejected_rate = 0
+        self.rejected_queue = 0
+        self.queued = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.upstream_calls = 0
+        self.upstream_seconds_total = 0.0
+        self.upstream_seconds_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[int] = None, on_position: Optional[PositionCallback] = None):
+        await self.acquire(user_id, on_position)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.upstream_calls += 1
+            self.upstream_seconds_total += elapsed
+            self.upstream_seconds_max = max(self.upstream_seconds_max, elapsed)
+            self.release()
+
+    def check(self, user_id: Optional[int] = None):
+        """Raise RateLimited if a call for `user_id` would be turned away right now.
+
+        Lets callers reject a request before doing any work for it. Nothing
+        is taken: the budget is only spent by acquire(), so a request that
+        never goes upstream (a cache hit) stays free.
+        """
+        if user_id is not None:
+            retry_after = self._bucket(user_id).wait_time()
+            if retry_after:
+                self.rejected_rate += 1
+                raise RateLimited("Too many requests", retry_after=round(retry_after, 1))
+        if self.waiting >= self.max_queue:
+            self.rejected_queue += 1
+            raise RateLimited("Server is busy, please try again shortly", retry_after=1)
+
+    async def acquire(self, user_id: Optional[int] = None, on_position: Optional[PositionCallback] = None):
+        if user_id is not None:
+            retry_after = self._bucket(user_id).take()
+            if retry_after:
+                self.rejected_rate += 1
+                raise RateLimited("Too many requests", retry_after=round(retry_after, 1))
+
+        if self.active < self.max_concurrency and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if self.waiting >= self.max_queue:
+            # Turned away without being served, so the token goes back
+            if user_id is not None:
+                self._bucket(user_id).refund()
+            self.rejected_queue += 1
+            raise RateLimited("Server is busy, please try again shortly", retry_after=1)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self.waiting += 1
+        self.queued += 1
+        self._notify_positions()
+        started = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we were cancelled; hand the slot on
+                self.release()
+            else:
+                self._discard(user_id, waiter)
+            raise
+        waited = time.perf_counter() - started
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        granted = False
+        while self.active < self.max_concurrency and self._queues:
+            # Round-robin: serve the user at the front, then move them to the back
+            user_id, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[user_id] = queue
+            self.waiting -= 1
+            if waiter.future.done():
+                continue
+            self.active += 1
+            waiter.future.set_result(None)
+            granted = True
+        if granted:
+            self._notify_positions()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_rate": self.rejected_rate,
+            "rejected_queue": self.rejected_queue,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+            "upstream_calls": self.upstream_calls,
+            "upstream_seconds_total": round(self.upstream_seconds_total, 3),
+            "upstream_seconds_max": round(self.upstream_seconds_max, 3),
+        }
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= 10000:
+                self._prune_buckets()
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _prune_buckets(self):
+        # A full bucket carries no state worth keeping
+        for user_id, bucket in list(self._buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[user_id]
+
+    def _discard(self, user_id: Optional[int], waiter: _Waiter):
+        queue = self._queues.get(user_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.waiting -= 1
+            if not queue:
+                del self._queues[user_id]
+            self._notify_positions()
+
+    def _notify_positions(self):
+        # Walk the queues in the order release() will serve them
+        queues = list(self._queues.values())
+        position = 0
+        depth = 0
+        while True:
+            served = False
+            for queue in queues:
+                if depth < len(queue):
+                    served = True
+                    position += 1
+                    waiter = queue[depth]
+                    if waiter.position != position and waiter.on_position is not None:
+                        waiter.on_position(position)
+                    waiter.position = position
+            if not served:
+                break
+            depth += 1
+
+
+admission = AdmissionScheduler(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    rate=settings.LLM_USER_RATE,
+    burst=settings.LLM_USER_BURST,
+    max_queue=settings.LLM_MAX_QUEUE
+)
@@ -0,0 +1,240 @@
+import asyncio
+import orjson
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+from uuid import uuid4
+from .config import settings
+
+logger = logging.getLogger("backplane")
+
+DeliverHandler = Callable[[int, List[dict]], Awaitable[None]]
+
+
+class BackplaneError(Exception):
+    pass
+
+
+class Backplane:
+    """Fans broadcasts out to every worker process.
+
+    `publish` is called by whichever worker produced a frame; the handler
+    passed to `start` is invoked on each worker to deliver frames to the
+    sockets that worker owns.
+    """
+
+    async def start(self, handler: DeliverHandler):
+        self._handler = handler
+
+    async def stop(self):
+        pass
+
+    async def publish(self, user_id: int, message: dict):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InProcessBackplane(Backplane):
+    """Single-worker default: every socket lives in this process."""
+
+    async def publish(self, user_id: int, message: dict):
+        await self._handler(user_id, [message])
+
+
+def _encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Backplane connection closed")
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b"+":
+        return rest.decode()
+    if prefix == b"-":
+        raise BackplaneError(rest.decode())
+    if prefix == b":":
+        return int(rest)
+    if prefix == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(rest)
+        if length == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise BackplaneError(f"Unexpected reply: {line!r}")
+
+
+class RedisBackplane(Backplane):
+    """Backplane over Redis pub/sub, spoken directly in RESP.
+
+    Frames for local sockets are delivered immediately. Frames are also
+    queued for the other workers and flushed as one PUBLISH per batch window,
+    grouped by user_id. Workers skip batches they published themselves.
+    A failed PUBLISH keeps its frames and retries with backoff; while Redis
+    is down at most `max_pending` frames are kept; the rest are
+    dropped and counted in `dropped`.
+    """
+
+    def __init__(self, url: str, channel: str, batch_interval: float = 0.002, max_pending: int = 10000):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.channel = channel
+        self.batch_interval = batch_interval
+        self.max_pending = max_pending
+        self.published = 0
+        self.retries = 0
+        self.dropped = 0
+        self.origin = uuid4().hex
+        self._pending: Dict[int, List[dict]] = {}
+        self._wakeup = asyncio.Event()
+        self._conn: Optional[tuple] = None
+        self._lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, handler: DeliverHandler):
+        await super().start(handler)
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._subscribe_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._conn is not None:
+            self._conn[1].close()
+            self._conn = None
+
+    async def publish(self, user_id: int, message: dict):
+        self._pending.setdefault(user_id, []).append(message)
+        self._wakeup.set()
+        await self._handler(user_id, [message])
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "pending": sum(len(messages) for messages in self._pending.values()),
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
+
+    async def command(self, *args):
+        """Run a single command on the shared publisher connection."""
+        async with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = await self._open()
+                reader, writer = self._conn
+                writer.write(_encode_command(*args))
+                await writer.drain()
+                return await _read_reply(reader)
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                if self._conn is not None:
+                    self._conn[1].close()
+                    self._conn = None
+                raise
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(_encode_command("AUTH", self.password))
+            await _read_reply(reader)
+        if self.db:
+            writer.write(_encode_command("SELECT", self.db))
+            await _read_reply(reader)
+        return reader, writer
+
+    async def _flush_loop(self):
+        backoff = 0.1
+        while True:
+            await self._wakeup.wait()
+            if self.batch_interval:
+                await asyncio.sleep(self.batch_interval)
+            self._wakeup.clear()
+            batches, self._pending = self._pending, {}
+            payload = orjson.dumps({"origin": self.origin, "batches": list(batches.items())})
+            try:
+                await self.command("PUBLISH", self.channel, payload)
+                self.published += sum(len(messages) for messages in batches.values())
+                backoff = 0.1
+            except Exception as e:
+                logger.error(f"Failed to publish {len(batches)} batches, retrying in {backoff}s: {e}")
+                self.retries += 1
+                self._requeue(batches)
+                self._wakeup.set()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 5)
+
+    def _requeue(self, batches: Dict[int, List[dict]]):
+        # Failed frames go back ahead of the ones queued since, so each user's frames stay in order
+        for user_id, messages in self._pending.items():
+            batches.setdefault(user_id, []).extend(messages)
+        self._pending = batches
+        excess = sum(len(messages) for messages in batches.values()) - self.max_pending
+        if excess <= 0:
+            return
+        logger.warning(f"Dropping {excess} frames waiting for the backplane")
+        self.dropped += excess
+        for user_id in list(batches):
+            dropped = batches[user_id][:excess]
+            del batches[user_id][:excess]
+            if not batches[user_id]:
+                del batches[user_id]
+            excess -= len(dropped)
+            if excess <= 0:
+                break
+
+    async def _subscribe_loop(self):
+        backoff = 0.5
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._open()
+                writer.write(_encode_command("SUBSCRIBE", self.channel))
+                await writer.drain()
+                backoff = 0.5
+                while True:
+                    reply = await _read_reply(reader)
+                    if not isinstance(reply, list) or reply[0] != b"message":
+                        continue
+                    payload = orjson.loads(reply[2])
+                    if payload["origin"] == self.origin:
+                        continue
+                    for user_id, messages in payload["batches"]:
+                        await self._handler(user_id, messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Backplane subscription lost, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+
+def create_backplane() -> Backplane:
+    if settings.BACKPLANE_URL:
+        return RedisBackplane(
+            settings.BACKPLANE_URL,
+            settings.BACKPLANE_CHANNEL,
+            batch_interval=settings.BACKPLANE_BATCH_MS / 1000,
+            max_pending=settings.BACKPLANE_MAX_PENDING
+        )
+    return InProcessBackplane()
@@ -2,14 +2,110 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./chatbot.db"
+    # Optional read replica; defaults to DATABASE_URL
+    DATABASE_READ_URL: str = ""
+    # Connection pools (Postgres); SQLite always uses one writer connection plus SQLITE_READ_POOL_SIZE readers
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    SQLITE_READ_POOL_SIZE: int = 4
+    # Pragmas applied to every SQLite connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64000  # negative means KiB, so about 64 MB
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
+    # Verified JWTs kept in memory so repeat requests skip the decode
+    AUTH_CACHE_SIZE: int = 10000
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     GOOGLE_CLIENT_ID: str
     GOOGLE_CLIENT_SECRET: str
+    # Google signing keys for ID token verification, cached per their Cache-Control
+    GOOGLE_CERTS_URL: str = "https://www.googleapis.com/oauth2/v3/certs"
+    GOOGLE_VERIFY_WORKERS: int = 4
     APPLE_CLIENT_ID: str
     APPLE_CLIENT_SECRET: str
     GEMINI_API_KEY: str
+    # "gemini" or "fake" (offline echo model, used for local testing)
+    LLM_PROVIDER: str = "gemini"
+    # Fake model behaviour: first-chunk and inter-chunk delay, +/- jitter fraction, failure share, and seed
+    FAKE_LLM_FIRST_CHUNK_MS: float = 50
+    FAKE_LLM_CHUNK_MS: float = 50
+    FAKE_LLM_JITTER: float = 0.0
+    FAKE_LLM_ERROR_RATE: float = 0.0
+    FAKE_LLM_SEED: int = 0
+    GEMINI_STREAMING: bool = True
+    # Prompt context: recent turns up to the token budget, older turns folded into a rolling summary
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_SUMMARY_WORDS: int = 250
+    CONTEXT_CACHE_THREADS: int = 1000
+    # Cross-thread recall: hashed TF-IDF vectors of each user's messages; the best matches from other threads go into the prompt
+    RETRIEVAL_ENABLED: bool = True
+    RETRIEVAL_DIM: int = 96
+    RETRIEVAL_TOP_K: int = 3
+    RETRIEVAL_MIN_SCORE: float = 0.65
+    RETRIEVAL_MAX_ROWS: int = 250000
+    RETRIEVAL_MAX_ROWS_PER_USER: int = 100000
+    RETRIEVAL_IDLE_SECONDS: int = 1800
+    # Reply cache in front of Gemini; LLM_CACHE_PATH enables the persistent SQLite tier
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_SIZE: int = 1024
+    LLM_CACHE_TTL: int = 3600
+    LLM_CACHE_PATH: str = ""
+    LLM_CACHE_PERSIST_TTL: int = 7 * 24 * 3600
+    LLM_CACHE_PERSIST_MAX_ROWS: int = 100000
+    # Admission control for upstream LLM calls: global concurrency, per-user token bucket, wait queue
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_USER_RATE: float = 0.5
+    LLM_USER_BURST: int = 5
+    LLM_MAX_QUEUE: int = 256
+    # Group commit for chat messages; ids are returned once the batch is committed
+    MESSAGE_WRITE_WINDOW_MS: float = 5
+    MESSAGE_WRITE_MAX_BATCH: int = 256
+    # "full" acks a batch once it is on disk (SQLite synchronous=FULL, Postgres synchronous_commit=on);
+    # "relaxed" acks once it is committed and leaves the flush to the WAL (synchronous=NORMAL /
+    # synchronous_commit=off), so a power cut can lose the last acked batches; "" keeps the connection's setting
+    MESSAGE_WRITE_DURABILITY: str = ""
+    # Account deletion runs in the background: rows per batch (one transaction each), pause between batches, polling interval
+    ACCOUNT_DELETE_BATCH: int = 1000
+    ACCOUNT_DELETE_PAUSE_MS: float = 10
+    ACCOUNT_DELETE_POLL_SECONDS: float = 30
+    # Queued plus running frames allowed per WebSocket connection
+    WS_MAX_INFLIGHT_PER_CONNECTION: int = 8
+    # Empty keeps WebSocket fan-out in-process; set to redis://host:port/db for multiple workers
+    BACKPLANE_URL: str = ""
+    BACKPLANE_CHANNEL: str = "chat:broadcast"
+    BACKPLANE_BATCH_MS: int = 2
+    # Frames kept for retry while Redis is unreachable; beyond this the oldest are dropped and counted
+    BACKPLANE_MAX_PENDING: int = 10000
+    # Outbound frames buffered per socket, and what to do when a slow client fills it:
+    # "drop_oldest", "coalesce" (merge streamed deltas) or "disconnect"
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_OVERFLOW_POLICY: str = "coalesce"
+    # Heartbeat: ping every socket once per interval, close it after WS_PONG_TIMEOUT seconds of silence
+    WS_PING_INTERVAL: float = 30
+    WS_PONG_TIMEOUT: float = 75
+    WS_HEARTBEAT_TICK: float = 1.0
+    # Session resume: frames kept per user for replay, users tracked, and the cap on a database catch-up
+    WS_RESUME_BUFFER: int = 256
+    WS_RESUME_USERS: int = 10000
+    WS_RESUME_DB_LIMIT: int = 500
+    # Signed single-use WebSocket tickets; replay checks are "local", "shared" (backplane Redis) or "auto"
+    WS_TICKET_TTL: int = 60
+    WS_TICKET_REPLAY: str = "auto"
+    WS_TICKET_MAX_PENDING: int = 100000
+    # Prometheus metrics at GET /metrics; keep it off the public internet
+    METRICS_ENABLED: bool = True
+    # Logs are queued and written by a background thread; LOG_FORMAT is "json" or "text"
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000
+    # Chat turn traces: every turn is timed, a TRACE_SAMPLE_RATE share plus any turn slower than TRACE_SLOW_MS is logged
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_SLOW_MS: float = 10000
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     ACCESS_TOKEN_EXPIRE_SECONDS: int = ACCESS_TOKEN_EXPIRE_MINUTES * 60
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+from sqlalchemy import select
+from .config import settings
+from .gemini_client import get_gemini_response, FALLBACK_RESPONSE
+from ..db.models import Message, ThreadContext
+from ..db.session import AsyncSessionLocal, AsyncReadSessionLocal
+
+logger = logging.getLogger("context")
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the new turns into the current summary. Keep names, facts, decisions and open "
+    "questions, drop pleasantries, and stay under {words} words. Reply with the summary only.\n\n"
+    "Current summary:\n{summary}\n\nNew turns:\n{turns}"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    id: int
+    is_bot: bool
+    content: str
+    tokens: int
+
+
+@dataclass
+class ThreadWindow:
+    summary: str = ""
+    summarized_upto_id: int = 0
+    turns: Deque[Turn] = field(default_factory=deque)
+    tokens: int = 0
+    # Turns that fell out of the window but are not in the summary yet
+    evicted: List[Turn] = field(default_factory=list)
+    compaction: Optional[asyncio.Task] = None
+
+
+class ContextBuilder:
+    """Builds the Gemini `contents` for a thread under a token budget.
+
+    Each thread keeps a sliding window of its most recent turns in memory.
+    Turns pushed out of the window are folded into a rolling summary in the
+    background, and the summary is stored in `thread_contexts` so it survives
+    restarts and cache evictions. Only the first turn on a thread after it
+    was evicted from the cache touches the `messages` table.
+    """
+
+    def __init__(self, token_budget: int, summary_words: int, max_threads: int):
+        self.token_budget = token_budget
+        self.summary_words = summary_words
+        self.max_threads = max_threads
+        self._windows: "OrderedDict[int, ThreadWindow]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Task] = {}
+
+    def add(self, thread_id: int, message_id: int, is_bot: bool, content: str):
+        """Record a saved message; a no-op if the thread's window is not cached."""
+        window = self._windows.get(thread_id)
+        if window is None or (window.turns and window.turns[-1].id >= message_id):
+            return
+        window.turns.append(Turn(message_id, is_bot, content, estimate_tokens(content)))
+        window.tokens += window.turns[-1].tokens
+        self._trim(thread_id, window)
+
+    async def build(self, thread_id: int) -> List[dict]:
+        window = await self._window(thread_id)
+        contents = []
+        if window.summary:
+            contents.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{window.summary}"]})
+        for turn in window.turns:
+            role = "model" if turn.is_bot else "user"
+            # Gemini expects alternating roles, so merge consecutive turns from the same side
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].append(turn.content)
+            elif contents or role == "user":
+                contents.append({"role": role, "parts": [turn.content]})
+        return contents
+
+    def discard(self, thread_id: int, message_id: int):
+        """Take back a turn whose message was deleted right after `add`."""
+        window = self._windows.get(thread_id)
+        if window is None:
+            return
+        for turn in window.turns:
+            if turn.id == message_id:
+                window.turns.remove(turn)
+                window.tokens -= turn.tokens
+                return
+        # Already pushed out towards the summary; rebuild from `messages` next time
+        self.forget(thread_id)
+
+    def forget(self, thread_id: int):
+        """Drop a thread's window, and any summary of it still being written."""
+        window = self._windows.pop(thread_id, None)
+        if window is not None and window.compaction is not None:
+            window.compaction.cancel()
+
+    async def _window(self, thread_id: int) -> ThreadWindow:
+        window = self._windows.get(thread_id)
+        if window is not None:
+            self._windows.move_to_end(thread_id)
+            return window
+        if thread_id not in self._loading:
+            self._loading[thread_id] = asyncio.create_task(self._load(thread_id))
+        try:
+            window = await asyncio.shield(self._loading[thread_id])
+        finally:
+            self._loading.pop(thread_id, None)
+        self._windows[thread_id] = window
+        while len(self._windows) > self.max_threads:
+            self._windows.popitem(last=False)
+        return window
+
+    async def _load(self, thread_id: int) -> ThreadWindow:
+        window = ThreadWindow()
+        async with AsyncReadSessionLocal() as db:
+            context = await db.get(ThreadContext, thread_id)
+            if context:
+                window.summary = context.summary
+                window.summarized_upto_id = context.summarized_upto_id
+            # Fetch a little more than fits so the overflow can seed the summary
+            rows = await db.execute(
+                select(Message.id, Message.is_bot, Message.content)
+                .filter(Message.thread_id == thread_id, Message.id > window.summarized_upto_id)
+                .order_by(Message.id.desc())
+                .limit(max(20, self.token_budget // 25))
+            )
+        for row in reversed(rows.all()):
+            turn = Turn(row.id, row.is_bot, row.content, estimate_tokens(row.content))
+            window.turns.append(turn)
+            window.tokens += turn.tokens
+        self._trim(thread_id, window)
+        return window
+
+    def _trim(self, thread_id: int, window: ThreadWindow):
+        budget = self.token_budget - estimate_tokens(window.summary)
+        # Always keep the newest turn, even if it alone is over budget
+        while window.tokens > budget and len(window.turns) > 1:
+            turn = window.turns.popleft()
+            window.tokens -= turn.tokens
+            window.evicted.append(turn)
+        if window.evicted and window.compaction is None:
+            window.compaction = asyncio.create_task(self._compact(thread_id, window))
+
+    async def _compact(self, thread_id: int, window: ThreadWindow):
+        try:
+            while window.evicted:
+                evicted = list(window.evicted)
+                turns = "\n".join(f"{'Assistant' if t.is_bot else 'User'}: {t.content}" for t in evicted)
+                summary = await get_gemini_response(SUMMARY_PROMPT.format(
+                    words=self.summary_words,
+                    summary=window.summary or "(empty)",
+                    turns=turns
+                ))
+                if summary == FALLBACK_RESPONSE:
+                    # Keep the turns queued and retry on the next eviction
+                    return
+                window.summary = summary.strip()
+                window.summarized_upto_id = evicted[-1].id
+                window.evicted = window.evicted[len(evicted):]
+                async with AsyncSessionLocal() as db:
+                    await db.merge(ThreadContext(
+                        thread_id=thread_id,
+                        summary=window.summary,
+                        summarized_upto_id=window.summarized_upto_id,
+                        updated_at=datetime.utcnow()
+                    ))
+                    await db.commit()
+        except Exception as e:
+            logger.error(f"Failed to compact context for thread {thread_id}: {e}")
+        finally:
+            window.compaction = None
+
+
+context_builder = ContextBuilder(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    summary_words=settings.CONTEXT_SUMMARY_WORDS,
+    max_threads=settings.CONTEXT_CACHE_THREADS
+)
@@ -0,0 +1,83 @@
+import asyncio
+import contextvars
+import logging
+from typing import Awaitable, Callable, Dict
+
+logger = logging.getLogger("dispatcher")
+
+
+class ThreadDispatcher:
+    """Processes one connection's frames concurrently across threads.
+
+    Every thread gets its own queue and worker task, so messages for the same
+    thread are handled in the order they arrived while different threads run
+    in parallel. `max_inflight` caps queued plus running work per connection.
+    Each frame is handled in a copy of the context it was submitted from, so
+    context variables like the current trace follow it into the worker.
+    """
+
+    def __init__(self, handler: Callable[[dict], Awaitable[None]], max_inflight: int = 8):
+        self.handler = handler
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self._closed = False
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._running: Dict[int, asyncio.Task] = {}
+
+    def submit(self, thread_id: int, data: dict) -> bool:
+        if self._closed or self.inflight >= self.max_inflight:
+            return False
+        self.inflight += 1
+        queue = self._queues.get(thread_id)
+        if queue is None:
+            queue = self._queues[thread_id] = asyncio.Queue()
+            self._workers[thread_id] = asyncio.create_task(self._work(thread_id, queue))
+        queue.put_nowait((data, contextvars.copy_context()))
+        return True
+
+    def cancel(self, thread_id: int) -> bool:
+        """Abort the frame currently being processed for `thread_id`, if any."""
+        job = self._running.get(thread_id)
+        if job is None or job.done():
+            return False
+        job.cancel()
+        return True
+
+    async def close(self, cancel: bool = False):
+        """Stop accepting work and wait for already queued frames to finish, or abort them with `cancel`."""
+        self._closed = True
+        for thread_id, queue in self._queues.items():
+            if cancel:
+                self._workers[thread_id].cancel()
+            else:
+                queue.put_nowait(None)
+        if self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+
+    async def _work(self, thread_id: int, queue: asyncio.Queue):
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                data, context = item
+                job = asyncio.create_task(self.handler(data), context=context)
+                self._running[thread_id] = job
+                try:
+                    await asyncio.wait([job])
+                finally:
+                    self._running.pop(thread_id, None)
+                    self.inflight -= 1
+                if not job.cancelled() and job.exception() is not None:
+                    logger.error(f"Failed to process frame for thread {thread_id}", exc_info=job.exception())
+                # Let idle threads release their worker
+                if queue.empty() and not self._closed:
+                    del self._queues[thread_id]
+                    del self._workers[thread_id]
+                    break
+        except asyncio.CancelledError:
+            job = self._running.get(thread_id)
+            if job is not None:
+                job.cancel()
+            raise
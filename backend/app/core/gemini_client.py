@@ -1,13 +1,162 @@
+import asyncio
+import logging
+import random
+import time
+from typing import AsyncIterator, List, Optional, Protocol, Tuple, Union
 import google.generativeai as genai
 from .config import settings
+from .admission import admission, PositionCallback
+from . import metrics
 
-genai.configure(api_key=settings.GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-pro')
+logger = logging.getLogger("gemini")
 
-async def get_gemini_response(prompt: str) -> str:
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request right now."
+
+
+class LLMModel(Protocol):
+    """What the chat path needs from a model, as google.generativeai's GenerativeModel provides it.
+
+    Without `stream` the call returns an object with the reply in `.text`;
+    with it, an async iterable of chunks that each carry `.text`.
+    """
+
+    async def generate_content_async(self, prompt, stream: bool = False): ...
+
+
+class FakeLLMError(Exception):
+    pass
+
+
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeStreamingResponse:
+    def __init__(self, chunks: List[str], delays: List[float]):
+        self._chunks = chunks
+        self._delays = delays
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    async def __aiter__(self):
+        for chunk, delay in zip(self._chunks, self._delays):
+            await asyncio.sleep(delay)
+            yield _FakeChunk(chunk)
+
+
+class FakeStreamingModel:
+    """Offline stand-in for GenerativeModel that echoes the prompt back word by word.
+
+    The first chunk arrives after `first_chunk_delay` and each later one
+    `chunk_delay` after the previous, both varied by up to +/- `jitter` of
+    themselves. An `error_rate` share of calls fail before anything is
+    sent. Jitter and failures come from a generator seeded with `seed` and
+    the prompt, so a given prompt behaves the same way on every run.
+    """
+
+    def __init__(
+        self,
+        first_chunk_delay: float = 0.05,
+        chunk_delay: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+
+    async def generate_content_async(self, prompt, stream: bool = False):
+        if isinstance(prompt, list):
+            prompt = prompt[-1]["parts"][-1]
+        rng = random.Random(f"{self.seed}:{prompt}")
+        if rng.random() < self.error_rate:
+            await asyncio.sleep(self._vary(rng, self.first_chunk_delay))
+            raise FakeLLMError("Simulated upstream failure")
+        words = f"You said: {prompt}".split(" ")
+        chunks = [word + " " for word in words[:-1]] + words[-1:]
+        delays = [self._vary(rng, self.first_chunk_delay)] + [self._vary(rng, self.chunk_delay) for _ in chunks[1:]]
+        if stream:
+            return _FakeStreamingResponse(chunks, delays)
+        await asyncio.sleep(sum(delays))
+        return _FakeChunk("".join(chunks))
+
+    def _vary(self, rng: random.Random, delay: float) -> float:
+        return max(delay * (1 + self.jitter * (2 * rng.random() - 1)), 0)
+
+
+def create_model(provider: str) -> Tuple[str, LLMModel]:
+    """The model name (part of the reply cache key) and model for LLM_PROVIDER."""
+    if provider == "fake":
+        return "fake", FakeStreamingModel(
+            first_chunk_delay=settings.FAKE_LLM_FIRST_CHUNK_MS / 1000,
+            chunk_delay=settings.FAKE_LLM_CHUNK_MS / 1000,
+            jitter=settings.FAKE_LLM_JITTER,
+            error_rate=settings.FAKE_LLM_ERROR_RATE,
+            seed=settings.FAKE_LLM_SEED
+        )
+    if provider == "gemini":
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        return "gemini-pro", genai.GenerativeModel("gemini-pro")
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+MODEL_NAME, model = create_model(settings.LLM_PROVIDER)
+
+async def _complete(prompt: Union[str, List[dict]]) -> str:
+    started = time.perf_counter()
     try:
         response = await model.generate_content_async(prompt)
         return response.text
     except Exception as e:
-        print(f"Error getting Gemini response: {e}")
-        return "I apologize, but I'm having trouble processing your request right now."
\ No newline at end of file
+        metrics.llm_errors.labels("complete").inc()
+        logger.error(f"Error getting Gemini response: {e}")
+        return FALLBACK_RESPONSE
+    finally:
+        metrics.llm_request_seconds.labels("complete").observe(time.perf_counter() - started)
+
+async def get_gemini_response(prompt: Union[str, List[dict]], user_id: Optional[int] = None) -> str:
+    async with admission.slot(user_id):
+        return await _complete(prompt)
+
+async def stream_gemini_response(
+    prompt: Union[str, List[dict]],
+    user_id: Optional[int] = None,
+    on_queue_position: Optional[PositionCallback] = None
+) -> AsyncIterator[str]:
+    """Yield the reply in chunks as Gemini produces them.
+
+    `prompt` is either a single message or a list of `contents` turns, as
+    built by ContextBuilder. The call waits for an admission slot first and
+    raises RateLimited if `user_id` is over its budget.
+
+    Falls back to a single chunk when streaming is disabled, and to the canned
+    apology if the call fails before anything was sent.
+    """
+    async with admission.slot(user_id, on_queue_position):
+        if not settings.GEMINI_STREAMING:
+            yield await _complete(prompt)
+            return
+
+        sent_any = False
+        started = time.perf_counter()
+        try:
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = chunk.text
+                if text:
+                    if not sent_any:
+                        metrics.llm_first_chunk_seconds.observe(time.perf_counter() - started)
+                    sent_any = True
+                    yield text
+        except Exception as e:
+            metrics.llm_errors.labels("stream").inc()
+            logger.error(f"Error streaming Gemini response: {e}")
+            if not sent_any:
+                yield FALLBACK_RESPONSE
+        finally:
+            metrics.llm_request_seconds.labels("stream").observe(time.perf_counter() - started)
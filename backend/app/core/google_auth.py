@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+import requests
+from jose import jwt, JWTError
+from .config import settings
+
+logger = logging.getLogger("google_auth")
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens without blocking the event loop.
+
+    Google's signing keys (JWKS) are kept in memory and refreshed in the
+    background when their Cache-Control max-age runs out; a token signed by
+    an unknown key triggers an early refresh, at most once per
+    `min_refresh_interval`. Fetches and RSA checks run in a thread pool.
+
+    Raises ValueError for tokens that do not verify, like
+    id_token.verify_oauth2_token did.
+    """
+
+    def __init__(self, client_id: str, certs_url: str, workers: int = 4, min_refresh_interval: float = 30):
+        self.client_id = client_id
+        self.certs_url = certs_url
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[str, dict] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="google-auth")
+        self.verified = 0
+        self.failed = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.verify_seconds_total = 0.0
+        self.verify_seconds_max = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def verify(self, token: str) -> dict:
+        started = time.perf_counter()
+        try:
+            try:
+                kid = jwt.get_unverified_header(token).get("kid")
+            except JWTError as e:
+                raise ValueError(f"Malformed token: {e}")
+            key = self._keys.get(kid)
+            if key is None:
+                await self.refresh(force=True)
+                key = self._keys.get(kid)
+                if key is None:
+                    raise ValueError("Token signed by an unknown key")
+            loop = asyncio.get_running_loop()
+            claims = await loop.run_in_executor(self._executor, self._decode, token, key)
+            self.verified += 1
+            return claims
+        except ValueError:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.verify_seconds_total += elapsed
+            self.verify_seconds_max = max(self.verify_seconds_max, elapsed)
+
+    async def refresh(self, force: bool = False):
+        """Fetch the keys; concurrent callers share one fetch."""
+        if force and time.time() - self._fetched_at < self.min_refresh_interval:
+            return
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._fetch())
+        task = self._refreshing
+        try:
+            await asyncio.shield(task)
+        finally:
+            if self._refreshing is task and task.done():
+                self._refreshing = None
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "keys_expire_in": round(max(self._expires_at - time.time(), 0), 1),
+            "verified": self.verified,
+            "failed": self.failed,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "verify_seconds_total": round(self.verify_seconds_total, 3),
+            "verify_seconds_max": round(self.verify_seconds_max, 3),
+        }
+
+    async def _refresh_loop(self):
+        backoff = 1
+        while True:
+            try:
+                await self.refresh()
+                backoff = 1
+                # Refresh a little before Google says the keys go stale
+                await asyncio.sleep(max(self._expires_at - time.time() - 60, self.min_refresh_interval))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to refresh Google signing keys, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 300)
+
+    async def _fetch(self):
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self._executor, self._get, self.certs_url)
+        except Exception:
+            self.refresh_failures += 1
+            raise
+        self._keys = {key["kid"]: key for key in response.json()["keys"]}
+        self._fetched_at = time.time()
+        self._expires_at = self._fetched_at + self._max_age(response.headers)
+        self.refreshes += 1
+
+    @staticmethod
+    def _get(url: str) -> requests.Response:
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _max_age(headers) -> float:
+        match = re.search(r"max-age=(\d+)", headers.get("Cache-Control", ""))
+        if not match:
+            return 3600
+        return max(int(match.group(1)) - int(headers.get("Age", 0) or 0), 0)
+
+    def _decode(self, token: str, key: dict) -> dict:
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=[key.get("alg", "RS256")],
+                audience=self.client_id,
+                options={"verify_at_hash": False}
+            )
+        except JWTError as e:
+            raise ValueError(f"Invalid token: {e}")
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        return claims
+
+
+google_verifier = GoogleTokenVerifier(
+    settings.GOOGLE_CLIENT_ID,
+    settings.GOOGLE_CERTS_URL,
+    workers=settings.GOOGLE_VERIFY_WORKERS
+)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Set
+
+logger = logging.getLogger("heartbeat")
+
+
+class HeartbeatService:
+    """Pings every socket on this worker from a single timing wheel.
+
+    The wheel has one slot per tick. A connection is placed in the slot just
+    behind the current position, so it is first visited one full interval
+    later and the ping load spreads evenly over the interval. Each tick visits
+    one slot: connections that have been silent for longer than `timeout` are
+    reaped, the rest get a ping queued.
+
+    Connections must expose `last_seen` (a time.monotonic() timestamp) and
+    `enqueue(message)`.
+    """
+
+    def __init__(
+        self,
+        reap: Callable[[object], Awaitable[None]],
+        interval: float = 30,
+        timeout: float = 75,
+        tick: float = 1.0
+    ):
+        self.reap = reap
+        self.interval = interval
+        self.timeout = timeout
+        self.tick = tick
+        self.slot_count = max(1, round(interval / tick))
+        self.wheel: List[Set[object]] = [set() for _ in range(self.slot_count)]
+        self.position = 0
+        self.pings_sent = 0
+        self.reaped = 0
+        self._slots = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def add(self, connection):
+        slot = (self.position - 1) % self.slot_count
+        self.wheel[slot].add(connection)
+        self._slots[connection] = slot
+
+    def remove(self, connection):
+        slot = self._slots.pop(connection, None)
+        if slot is not None:
+            self.wheel[slot].discard(connection)
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self._slots),
+            "reaped": self.reaped,
+            "pings_sent": self.pings_sent,
+        }
+
+    async def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            await asyncio.sleep(max(0, next_tick - time.monotonic()))
+            try:
+                await self._visit(self.wheel[self.position])
+            except Exception as e:
+                logger.error(f"Heartbeat tick failed: {e}")
+            self.position = (self.position + 1) % self.slot_count
+
+    async def _visit(self, slot: Set[object]):
+        now = time.monotonic()
+        expired = []
+        for connection in slot:
+            if now - connection.last_seen > self.timeout:
+                expired.append(connection)
+            else:
+                connection.enqueue({"type": "ping"})
+                self.pings_sent += 1
+        for connection in expired:
+            self.remove(connection)
+            self.reaped += 1
+            await self.reap(connection)
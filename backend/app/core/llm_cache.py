@@ -0,0 +1,231 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+from cachetools import TTLCache
+from .config import settings
+from .gemini_client import stream_gemini_response, FALLBACK_RESPONSE, MODEL_NAME
+from .admission import PositionCallback
+
+logger = logging.getLogger("llm_cache")
+
+
+class _Inflight:
+    """A reply being streamed by one caller that identical requests can follow."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.failed = False
+        self.changed = asyncio.Event()
+
+    def publish(self, chunk: Optional[str] = None, done: bool = False, failed: bool = False):
+        if chunk is not None:
+            self.chunks.append(chunk)
+        self.done = self.done or done
+        self.failed = self.failed or failed
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class _SqliteTier:
+    """Persistent second tier; sqlite3 calls run in a worker thread.
+
+    Every `prune_every` writes (and on open), expired rows are deleted and
+    the oldest are trimmed down to `max_rows`.
+    """
+
+    def __init__(self, path: str, ttl: float, max_rows: int, prune_every: int = 256):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self.pruned = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)")
+        self._conn.commit()
+        with self._lock:
+            self._prune()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND created_at > ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, time.time())
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune()
+
+    def _prune(self):
+        expired = self._conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (time.time() - self.ttl,)).rowcount
+        excess = self._conn.execute("SELECT count(*) FROM llm_cache").fetchone()[0] - self.max_rows
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY created_at LIMIT ?)",
+                (excess,)
+            )
+        self._conn.commit()
+        self.pruned += expired + max(excess, 0)
+
+
+class ResponseCache:
+    """Caches complete LLM replies in front of the streaming Gemini call.
+
+    Lookups go to an in-memory LRU+TTL tier, then to the optional SQLite tier.
+    A miss streams from upstream; identical requests arriving meanwhile follow
+    that stream instead of making their own call. Failed replies (the canned
+    apology) are never stored.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, path: str = "", persist_ttl: float = 0, persist_max_rows: int = 100000):
+        self._memory = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._persistent = _SqliteTier(path, persist_ttl or ttl, persist_max_rows) if path else None
+        self._inflight: Dict[str, _Inflight] = {}
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def key(contents: Union[str, List[dict]], model_name: str = MODEL_NAME) -> str:
+        if isinstance(contents, str):
+            contents = [{"role": "user", "parts": [contents]}]
+        # Case and whitespace differences should still hit
+        normalized = [
+            [turn["role"], [" ".join(str(part).split()).casefold() for part in turn["parts"]]]
+            for turn in contents
+        ]
+        payload = json.dumps([model_name, normalized], separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "bypassed": self.bypassed,
+            "entries": len(self._memory),
+            "persistent_pruned": self._persistent.pruned if self._persistent is not None else 0,
+            "inflight": len(self._inflight),
+        }
+
+    async def stream(
+        self,
+        contents: Union[str, List[dict]],
+        upstream: Callable[[], AsyncIterator[str]],
+        use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        if not use_cache:
+            self.bypassed += 1
+            async for chunk in upstream():
+                yield chunk
+            return
+
+        key = self.key(contents)
+        cached = await self._get(key)
+        if cached is not None:
+            self.hits += 1
+            yield cached
+            return
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            sent = 0
+            while True:
+                changed = inflight.changed
+                while sent < len(inflight.chunks):
+                    yield inflight.chunks[sent]
+                    sent += 1
+                if inflight.done:
+                    break
+                if inflight.failed:
+                    # The leading request went away; answer this one directly
+                    if sent == 0:
+                        async for chunk in upstream():
+                            yield chunk
+                    return
+                await changed.wait()
+            return
+
+        self.misses += 1
+        inflight = self._inflight[key] = _Inflight()
+        try:
+            async for chunk in upstream():
+                inflight.publish(chunk)
+                yield chunk
+            response = "".join(inflight.chunks)
+            inflight.publish(done=True)
+            if response and response != FALLBACK_RESPONSE:
+                await self._set(key, response)
+        finally:
+            if not inflight.done:
+                inflight.publish(failed=True)
+            self._inflight.pop(key, None)
+
+    async def _get(self, key: str) -> Optional[str]:
+        cached = self._memory.get(key)
+        if cached is None and self._persistent is not None:
+            try:
+                cached = await asyncio.to_thread(self._persistent.get, key)
+            except Exception as e:
+                logger.error(f"Persistent cache lookup failed: {e}")
+            if cached is not None:
+                self.persistent_hits += 1
+                self._memory[key] = cached
+        return cached
+
+    async def _set(self, key: str, response: str):
+        self._memory[key] = response
+        if self._persistent is not None:
+            try:
+                await asyncio.to_thread(self._persistent.set, key, response)
+            except Exception as e:
+                logger.error(f"Persistent cache write failed: {e}")
+
+
+response_cache = ResponseCache(
+    max_entries=settings.LLM_CACHE_SIZE,
+    ttl=settings.LLM_CACHE_TTL,
+    path=settings.LLM_CACHE_PATH,
+    persist_ttl=settings.LLM_CACHE_PERSIST_TTL,
+    persist_max_rows=settings.LLM_CACHE_PERSIST_MAX_ROWS
+)
+
+
+async def cached_gemini_stream(
+    contents: Union[str, List[dict]],
+    use_cache: bool = True,
+    user_id: Optional[int] = None,
+    on_queue_position: Optional[PositionCallback] = None
+) -> AsyncIterator[str]:
+    """stream_gemini_response behind the response cache; pass use_cache=False to bypass it.
+
+    Only misses go upstream, so cache hits and coalesced requests do not use
+    the user's admission budget.
+    """
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    upstream = lambda: stream_gemini_response(contents, user_id, on_queue_position)
+    async for chunk in response_cache.stream(contents, upstream, use_cache):
+        yield chunk
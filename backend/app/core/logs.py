@@ -0,0 +1,99 @@
+import atexit
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import orjson
+from .config import settings
+from . import tracing
+
+# Log records are queued by the calling thread and written by a listener
+# thread, so logging never blocks the event loop on stdout. When the queue
+# is full, records are dropped and counted rather than waited on.
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the trace id and any trace attached to the record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        trace = getattr(record, "trace", None)
+        if trace is not None:
+            entry["trace"] = trace
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only what depends on the caller happens here: the message arguments
+        # may change once we return, and the current trace is a context
+        # variable. Formatting is left to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        record.trace_id = tracing.trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped}
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room, so shutdown still writes out a full queue
+        self.queue.put(self._sentinel)
+
+
+handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[_Listener] = None
+
+def setup_logging():
+    """Route the root logger and uvicorn's loggers through the queue."""
+    global handler, _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(settings.LOG_LEVEL)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+
+    _listener = _Listener(log_queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Write out what is still queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
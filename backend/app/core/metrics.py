@@ -0,0 +1,211 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Prometheus metrics, rendered in the text exposition format by GET /metrics.
+#
+# Recording is meant to be cheap enough for every query and frame: each
+# metric keeps one array of values per thread that records into it, so an
+# increment is a thread-local lookup and a list update with no lock. The
+# arrays are summed when /metrics is scraped.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _Shards:
+    """Per-thread value arrays, summed on read."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._all: List[list] = []
+        self._lock = threading.Lock()
+
+    def values(self) -> list:
+        """This thread's array; only the first call per thread takes the lock."""
+        values = self._local.values = [0] * self.size
+        with self._lock:
+            self._all.append(values)
+        return values
+
+    def total(self) -> list:
+        with self._lock:
+            shards = list(self._all)
+        return [sum(column) for column in zip(*shards)] if shards else [0] * self.size
+
+
+class _CounterChild(_Shards):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1):
+        try:
+            self._local.values[0] += amount
+        except AttributeError:
+            self.values()[0] += amount
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        yield f"{name}{labels} {_number(self.total()[0])}"
+
+
+class _HistogramChild(_Shards):
+    def __init__(self, buckets: Tuple[float, ...]):
+        # One slot per bucket, one for +Inf, then the sum
+        super().__init__(len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value: float):
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self.values()
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def samples(self, name: str, labels: str) -> Iterable[str]:
+        values = self.total()
+        prefix = labels[:-1] + "," if labels else "{"
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), values):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(bound)
+            yield f'{name}_bucket{prefix}le="{le}"}} {cumulative}'
+        yield f"{name}_sum{labels} {_number(values[-1])}"
+        yield f"{name}_count{labels} {cumulative}"
+
+
+class Metric:
+    """A named metric family; `labels(...)` returns the child for one label set."""
+
+    def __init__(self, kind: str, name: str, help: str, labelnames: Tuple[str, ...], factory: Callable):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._factory = factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not labelnames:
+            # Unlabelled metrics record straight into their only child
+            default = self.labels()
+            self.inc = getattr(default, "inc", None)
+            self.observe = getattr(default, "observe", None)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values))
+            yield from child.samples(self.name, f"{{{labels}}}" if labels else "")
+
+
+class Registry:
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._metrics: List[Metric] = []
+        self._collectors: List[Tuple[str, Callable[[], dict]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Metric:
+        return self._add(Metric("counter", f"{self.namespace}_{name}", help, labelnames, _CounterChild))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Metric:
+        buckets = tuple(sorted(buckets))
+        return self._add(Metric("histogram", f"{self.namespace}_{name}", help, labelnames, lambda: _HistogramChild(buckets)))
+
+    def collect(self, prefix: str, stats: Callable[[], dict]):
+        """Publish the numbers in `stats()` as gauges named <namespace>_<prefix>_<key> on every scrape."""
+        self._collectors.append((f"{self.namespace}_{prefix}", stats))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats in self._collectors:
+            for name, value in _flatten(prefix, stats()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+
+def _flatten(prefix: str, stats: dict) -> Iterable[Tuple[str, float]]:
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)):
+            # Strings (like the epoch) and per-connection lists stay out of the exposition
+            yield name, float(value)
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry("chatbot")
+
+http_request_seconds = registry.histogram(
+    "http_request_seconds", "HTTP request latency until the response finished", ("method", "route", "status")
+)
+db_query_seconds = registry.histogram(
+    "db_query_seconds", "Database statement latency", ("engine", "statement")
+)
+db_errors = registry.counter("db_errors_total", "Database statements that raised", ("engine",))
+llm_request_seconds = registry.histogram(
+    "llm_request_seconds", "Upstream LLM call latency, to the last chunk when streaming", ("mode",),
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+llm_first_chunk_seconds = registry.histogram(
+    "llm_first_chunk_seconds", "Time from a streaming LLM call to its first chunk",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15)
+)
+llm_errors = registry.counter("llm_errors_total", "Upstream LLM calls that failed", ("mode",))
+ws_frames_received = registry.counter("ws_frames_received_total", "WebSocket frames received from clients")
+ws_frames_sent = registry.counter("ws_frames_sent_total", "WebSocket frames sent to clients")
+ws_send_seconds = registry.histogram(
+    "ws_send_seconds", "Time to hand one frame to a socket",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests by method, route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router leaves the matched route in the scope; label by its template to keep cardinality bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_seconds.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
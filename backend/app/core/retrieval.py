@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import logging
+import random
+import re
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from .config import settings
+from ..db.models import Message, Thread
+from ..db.session import AsyncReadSessionLocal
+
+logger = logging.getLogger("retrieval")
+
+TOKEN_RE = re.compile(r"\w\w+")
+# Function words carry no topic, and in a small index they are rare enough to get a high IDF
+STOP_WORDS = frozenset("""
+about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how if in into is it its itself just me more most my
+myself no nor not now of off on once only or other our ours ourselves out over own same she should so
+some such than that the their theirs them themselves then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your
+yours yourself yourselves like get got im ive dont thanks please hi hello ok okay yes
+""".split())
+LOAD_BATCH = 5000
+# Indexes larger than this are searched on the retrieval thread instead of the event loop
+INLINE_ROWS = 20000
+SNIPPET_CHARS = 300
+
+RECALL_PROMPT = (
+    "Excerpts from the user's earlier conversations that may be relevant. "
+    "Use them only if they help with the message below.\n{excerpts}"
+)
+
+
+def vectorize(texts: List[str], dim: int) -> np.ndarray:
+    """Hashed term frequencies, one L2-normalized float32 row per text.
+
+    Each word is hashed (crc32) to a column and a sign; the sign makes
+    collisions cancel out on average instead of piling up. Counts are
+    log-scaled so a repeated word does not dominate.
+    """
+    tokens: List[str] = []
+    rows: List[int] = []
+    for row, text in enumerate(texts):
+        words = [word for word in TOKEN_RE.findall(text.lower()) if word not in STOP_WORDS]
+        tokens.extend(words)
+        rows.extend([row] * len(words))
+    if not tokens:
+        return np.zeros((len(texts), dim), dtype=np.float32)
+    hashes = np.fromiter((zlib.crc32(token.encode()) for token in tokens), dtype=np.uint32, count=len(tokens))
+    signs = np.where(hashes & 0x80000000, 1.0, -1.0)
+    cells = np.asarray(rows, dtype=np.int64) * dim + (hashes % dim)
+    matrix = np.bincount(cells, weights=signs, minlength=len(texts) * dim).reshape(len(texts), dim)
+    matrix = (np.sign(matrix) * np.log1p(np.abs(matrix))).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class UserIndex:
+    """One user's message vectors in arrays that grow by doubling.
+
+    `df` counts the rows with a non-zero value in each column. IDF weights
+    are applied to the query only, so stored rows never need rewriting as
+    the counts change.
+    """
+
+    def __init__(self, dim: int, capacity: int = 256):
+        self.dim = dim
+        self.size = 0
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.message_ids = np.zeros(capacity, dtype=np.int64)
+        self.thread_ids = np.zeros(capacity, dtype=np.int64)
+        self.df = np.zeros(dim, dtype=np.float32)
+        self.last_used = time.monotonic()
+
+    @property
+    def max_id(self) -> int:
+        return int(self.message_ids[self.size - 1]) if self.size else 0
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.message_ids.nbytes + self.thread_ids.nbytes
+
+    def append(self, message_ids: List[int], thread_ids: List[int], vectors: np.ndarray):
+        end = self.size + len(message_ids)
+        if end > len(self.message_ids):
+            self._resize(max(end, 2 * len(self.message_ids)), keep_from=0)
+        self.vectors[self.size:end] = vectors
+        self.message_ids[self.size:end] = message_ids
+        self.thread_ids[self.size:end] = thread_ids
+        self.df += np.count_nonzero(vectors, axis=0)
+        self.size = end
+
+    def trim(self, max_rows: int):
+        """Drop the oldest rows down to 90% of `max_rows`, so trimming is not needed on every append."""
+        if self.size > max_rows:
+            drop = self.size - int(max_rows * 0.9)
+            self.df -= np.count_nonzero(self.vectors[:drop], axis=0)
+            self._resize(len(self.message_ids), keep_from=drop)
+
+    def search(self, query: np.ndarray, k: int, exclude_thread: Optional[int] = None) -> List[Tuple[int, float]]:
+        """The `k` best (message id, cosine score) pairs for a vectorized query."""
+        # Take the arrays once; appends only write past `size` and resizes replace the arrays
+        size, vectors, message_ids, thread_ids = self.size, self.vectors, self.message_ids, self.thread_ids
+        if size == 0:
+            return []
+        weighted = query * (np.log((size + 1) / (self.df + 1)) + 1)
+        norm = np.linalg.norm(weighted)
+        if norm == 0:
+            return []
+        scores = vectors[:size] @ (weighted / norm).astype(np.float32)
+        if exclude_thread is not None:
+            scores[thread_ids[:size] == exclude_thread] = -np.inf
+        k = min(k, size)
+        top = np.argpartition(scores, size - k)[size - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(message_ids[i]), float(scores[i])) for i in top if scores[i] > -np.inf]
+
+    def _resize(self, capacity: int, keep_from: int):
+        # New arrays rather than in-place shifts, so a search running on another thread keeps a consistent view
+        kept = self.size - keep_from
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        message_ids = np.zeros(capacity, dtype=np.int64)
+        thread_ids = np.zeros(capacity, dtype=np.int64)
+        vectors[:kept] = self.vectors[keep_from:self.size]
+        message_ids[:kept] = self.message_ids[keep_from:self.size]
+        thread_ids[:kept] = self.thread_ids[keep_from:self.size]
+        self.vectors, self.message_ids, self.thread_ids = vectors, message_ids, thread_ids
+        self.size = kept
+
+
+class RetrievalIndex:
+    """Recall of related messages from a user's other threads, to ground replies.
+
+    A user's index is built from `messages` in the background the first
+    time they chat (that turn goes without recall), then kept current by
+    `add` as messages are saved. Users idle for `idle_seconds` are evicted,
+    and the least recently used ones go first whenever the indexes together
+    hold more than `max_rows` rows.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        top_k: int,
+        min_score: float,
+        max_rows: int,
+        max_rows_per_user: int,
+        idle_seconds: float
+    ):
+        self.dim = dim
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_rows = max_rows
+        self.max_rows_per_user = max_rows_per_user
+        self.idle_seconds = idle_seconds
+        self._users: "OrderedDict[int, UserIndex]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Task] = {}
+        self._pending: Dict[int, List[Tuple[int, int, str]]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieval")
+        self._last_sweep = time.monotonic()
+        self.lookups = 0
+        self.recalled = 0
+        self.loads = 0
+        self.evictions = 0
+        self.lookup_seconds_total = 0.0
+        self.lookup_seconds_max = 0.0
+
+    def add(self, user_id: int, thread_id: int, message_id: int, content: str):
+        """Index a saved message; a no-op if the user's index is not in memory."""
+        index = self._users.get(user_id)
+        if index is not None:
+            if message_id > index.max_id:
+                index.append([message_id], [thread_id], vectorize([content], self.dim))
+                index.trim(self.max_rows_per_user)
+        elif user_id in self._pending:
+            self._pending[user_id].append((message_id, thread_id, content))
+
+    def forget(self, user_id: int):
+        self._users.pop(user_id, None)
+        self._pending.pop(user_id, None)
+        task = self._loading.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def search(self, user_id: int, thread_id: Optional[int], text: str) -> List[Tuple[int, float]]:
+        """Best matches for `text` among the user's messages outside `thread_id`."""
+        self._sweep()
+        index = self._users.get(user_id)
+        if index is None:
+            if user_id not in self._loading:
+                self._pending[user_id] = []
+                self._loading[user_id] = asyncio.create_task(self._load(user_id))
+            return []
+        self._users.move_to_end(user_id)
+        index.last_used = time.monotonic()
+
+        started = time.perf_counter()
+        query = vectorize([text], self.dim)[0]
+        if index.size > INLINE_ROWS:
+            loop = asyncio.get_running_loop()
+            matches = await loop.run_in_executor(self._executor, index.search, query, self.top_k, thread_id)
+        else:
+            matches = index.search(query, self.top_k, thread_id)
+        elapsed = time.perf_counter() - started
+        self.lookups += 1
+        self.lookup_seconds_total += elapsed
+        self.lookup_seconds_max = max(self.lookup_seconds_max, elapsed)
+        return [(message_id, score) for message_id, score in matches if score >= self.min_score]
+
+    async def ground(self, user_id: int, thread_id: int, text: str, contents: List[dict]) -> List[dict]:
+        """Return `contents` with the best matches from other threads placed before the latest user turn."""
+        matches = await self.search(user_id, thread_id, text)
+        if not matches:
+            return contents
+        async with AsyncReadSessionLocal() as db:
+            rows = await db.execute(
+                select(Message.id, Message.content, Message.is_bot, Thread.title)
+                .join(Thread, Thread.id == Message.thread_id)
+                .filter(Message.id.in_([message_id for message_id, _ in matches]), Thread.user_id == user_id)
+            )
+            rows = {row.id: row for row in rows}
+        excerpts = [
+            f"- [{rows[message_id].title}] {'Assistant' if rows[message_id].is_bot else 'User'}: "
+            f"{' '.join(rows[message_id].content.split())[:SNIPPET_CHARS]}"
+            for message_id, _ in matches if message_id in rows
+        ]
+        if not excerpts:
+            return contents
+        self.recalled += len(excerpts)
+        recall = RECALL_PROMPT.format(excerpts="\n".join(excerpts))
+        if contents and contents[-1]["role"] == "user":
+            return contents[:-1] + [{"role": "user", "parts": [recall] + contents[-1]["parts"]}]
+        return contents + [{"role": "user", "parts": [recall]}]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "loading": len(self._loading),
+            "rows": sum(index.size for index in self._users.values()),
+            "bytes": sum(index.nbytes for index in self._users.values()),
+            "lookups": self.lookups,
+            "recalled": self.recalled,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "lookup_seconds_total": round(self.lookup_seconds_total, 3),
+            "lookup_seconds_max": round(self.lookup_seconds_max, 4),
+        }
+
+    async def _load(self, user_id: int):
+        loop = asyncio.get_running_loop()
+        index = UserIndex(self.dim)
+        try:
+            async with AsyncReadSessionLocal() as db:
+                # Start at the newest max_rows_per_user messages
+                after = (await db.execute(
+                    select(Message.id)
+                    .join(Thread, Thread.id == Message.thread_id)
+                    .filter(Thread.user_id == user_id)
+                    .order_by(Message.id.desc())
+                    .offset(self.max_rows_per_user)
+                    .limit(1)
+                )).scalar() or 0
+                while True:
+                    rows = (await db.execute(
+                        select(Message.id, Message.thread_id, Message.content)
+                        .join(Thread, Thread.id == Message.thread_id)
+                        .filter(Thread.user_id == user_id, Message.id > after)
+                        .order_by(Message.id)
+                        .limit(LOAD_BATCH)
+                    )).all()
+                    if not rows:
+                        break
+                    # Hashing is pure Python; on the retrieval thread it at least shares the GIL with the loop
+                    vectors = await loop.run_in_executor(self._executor, vectorize, [row.content for row in rows], self.dim)
+                    index.append([row.id for row in rows], [row.thread_id for row in rows], vectors)
+                    after = rows[-1].id
+            # Messages saved while loading, in case the last batch missed them
+            pending = [entry for entry in self._pending.pop(user_id, []) if entry[0] > index.max_id]
+            if pending:
+                index.append(
+                    [message_id for message_id, _, _ in pending],
+                    [thread_id for _, thread_id, _ in pending],
+                    vectorize([content for _, _, content in pending], self.dim)
+                )
+            index.trim(self.max_rows_per_user)
+            self._users[user_id] = index
+            self.loads += 1
+            self._evict_over_budget()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._pending.pop(user_id, None)
+            logger.error(f"Failed to build the retrieval index for user {user_id}: {e}")
+        finally:
+            self._loading.pop(user_id, None)
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for user_id, index in list(self._users.items()):
+            if now - index.last_used > self.idle_seconds:
+                del self._users[user_id]
+                self.evictions += 1
+
+    def _evict_over_budget(self):
+        rows = sum(index.size for index in self._users.values())
+        # Keep at least the most recent user, even if it alone is over budget
+        while rows > self.max_rows and len(self._users) > 1:
+            _, index = self._users.popitem(last=False)
+            rows -= index.size
+            self.evictions += 1
+
+
+retrieval_index = RetrievalIndex(
+    dim=settings.RETRIEVAL_DIM,
+    top_k=settings.RETRIEVAL_TOP_K,
+    min_score=settings.RETRIEVAL_MIN_SCORE,
+    max_rows=settings.RETRIEVAL_MAX_ROWS,
+    max_rows_per_user=settings.RETRIEVAL_MAX_ROWS_PER_USER,
+    idle_seconds=settings.RETRIEVAL_IDLE_SECONDS
+)
+
+
+def bench(messages: int, queries: int, dim: int, seed: int = 0):
+    """Time lookups in one user's index of generated messages."""
+    from ..db.fts import WORDS
+    rng = random.Random(seed)
+    vocabulary = WORDS + [f"term{i}" for i in range(5000)]
+    texts = [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 60))) for _ in range(messages)]
+
+    started = time.perf_counter()
+    index = UserIndex(dim)
+    for offset in range(0, messages, LOAD_BATCH):
+        batch = texts[offset:offset + LOAD_BATCH]
+        ids = list(range(offset + 1, offset + len(batch) + 1))
+        index.append(ids, [message_id % 100 for message_id in ids], vectorize(batch, dim))
+    print(f"Indexed {messages} messages in {time.perf_counter() - started:.1f}s, {index.nbytes / 1e6:.1f} MB")
+
+    timings = []
+    found = 0
+    for _ in range(queries):
+        # Query with a fragment of a stored message, as a follow-up on an old topic would
+        target = rng.randrange(messages)
+        words = texts[target].split()
+        text = " ".join(words[:max(3, len(words) // 3)])
+        started = time.perf_counter()
+        matches = index.search(vectorize([text], dim)[0], 3, exclude_thread=rng.randrange(100))
+        timings.append((time.perf_counter() - started) * 1000)
+        found += any(message_id == target + 1 for message_id, _ in matches)
+    timings.sort()
+    print(
+        f"{queries} lookups: p50 {timings[len(timings) // 2]:.2f}ms "
+        f"p95 {timings[int(len(timings) * 0.95)]:.2f}ms max {timings[-1]:.2f}ms, "
+        f"source message in the top 3 for {found / queries:.0%}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-thread retrieval index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="time lookups on a generated corpus")
+    bench_parser.add_argument("--messages", type=int, default=100000)
+    bench_parser.add_argument("--queries", type=int, default=200)
+    bench_parser.add_argument("--dim", type=int, default=settings.RETRIEVAL_DIM)
+    args = parser.parse_args()
+    bench(args.messages, args.queries, args.dim)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+import argparse
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from fastapi import HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
@@ -28,15 +33,166 @@ def create_refresh_token(data: dict):
 #     except JWTError:
 #         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def verify_token(request: Request):
-    token = request.cookies.get("access_token")
-    if not token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+class TokenCache:
+    """Bounded LRU of verified tokens, keyed by SHA-256 of the token.
+
+    Holds (user_id, exp) so repeat requests with the same cookie skip
+    jwt.decode; entries are dropped once the token expires. Revoked tokens
+    go on a denylist until their own expiry. Both are per process.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, digest: str) -> Optional[int]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        user_id, exp = entry
+        if exp <= time.time():
+            del self._entries[digest]
+            return None
+        self._entries.move_to_end(digest)
+        return user_id
+
+    def put(self, digest: str, user_id: int, exp: float):
+        self._entries[digest] = (user_id, exp)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def revoke(self, digest: str, exp: float):
+        self._entries.pop(digest, None)
+        now = time.time()
+        if len(self._revoked) >= self.max_entries:
+            self._revoked = {key: until for key, until in self._revoked.items() if until > now}
+        self._revoked[digest] = exp
+
+    def is_revoked(self, digest: str) -> bool:
+        until = self._revoked.get(digest)
+        if until is None:
+            return False
+        if until <= time.time():
+            del self._revoked[digest]
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "revoked": len(self._revoked),
+        }
+
+
+token_cache = TokenCache(settings.AUTH_CACHE_SIZE)
+
+# Users whose account is deleted or being deleted; every token of theirs is refused.
+# Per process, filled from account_deletions by the deletion job
+revoked_users: Set[int] = set()
+
+def revoke_user(user_id: int):
+    revoked_users.add(user_id)
+
+def decode_token(token: str) -> int:
+    """Return the user id for a valid, unrevoked JWT, going through token_cache."""
+    digest = token_cache.digest(token)
+    if token_cache.is_revoked(digest):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    user_id = token_cache.get(digest)
+    if user_id is not None:
+        token_cache.hits += 1
+        return _unless_revoked(user_id)
+    token_cache.misses += 1
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        return int(user_id)
+        user_id = int(user_id)
+    except (JWTError, ValueError):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    # python-jose enforces exp, so a decoded token without one never expires
+    token_cache.put(digest, user_id, payload.get("exp", float("inf")))
+    return _unless_revoked(user_id)
+
+def _unless_revoked(user_id: int) -> int:
+    if user_id in revoked_users:
+        raise HTTPException(status_code=401, detail="Account deleted")
+    return user_id
+
+def revoke_token(token: str):
+    # Only tokens we signed and that are still valid need to be (and can be) denylisted
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        return
+    token_cache.revoke(token_cache.digest(token), payload.get("exp", time.time() + settings.REFRESH_TOKEN_EXPIRE_SECONDS))
+
+def is_revoked(token: str) -> bool:
+    return token_cache.is_revoked(token_cache.digest(token))
+
+async def verify_token(request: Request):
+    token = request.cookies.get("access_token")
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return decode_token(token)
+
+def bench(requests: int, tokens: int):
+    """Time per-request auth: a plain jwt.decode against decode_token with a cold and a warm cache."""
+    live = [create_access_token({"sub": str(user_id)}) for user_id in range(1, tokens + 1)]
+
+    def timed(label: str, check, pool) -> float:
+        started = time.perf_counter()
+        for i in range(requests):
+            check(pool[i % len(pool)])
+        per_request = (time.perf_counter() - started) / requests * 1e6
+        print(f"{label:<40} {per_request:8.2f}us per request")
+        return per_request
+
+    uncached = timed("jwt.decode (no cache)", lambda token: jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM]), live)
+    # A cache too small to keep anything: every request misses, so this is the decode plus the cache's overhead
+    token_cache.max_entries = 0
+    timed("decode_token, cache miss", decode_token, live)
+    token_cache.max_entries = max(settings.AUTH_CACHE_SIZE, tokens)
+    for token in live:
+        decode_token(token)
+    cached = timed("decode_token, cache hit", decode_token, live)
+    # Logged-out tokens fill the denylist; live tokens are still checked against it first
+    for user_id in range(tokens + 1, 2 * tokens + 1):
+        revoke_token(create_access_token({"sub": str(user_id)}))
+    timed(f"decode_token, hit + {len(token_cache._revoked)} denylisted", decode_token, live)
+    revoked = [create_access_token({"sub": str(user_id)}) for user_id in range(1, 101)]
+    for token in revoked:
+        revoke_token(token)
+
+    def refused(token: str):
+        try:
+            decode_token(token)
+        except HTTPException:
+            return
+        raise AssertionError("revoked token accepted")
+
+    timed("decode_token, revoked token", refused, revoked)
+    print(f"cache hit is {uncached / cached:.0f}x faster than jwt.decode")
+
+def main():
+    parser = argparse.ArgumentParser(description="JWT verification")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench_parser = commands.add_parser("bench", help="time per-request token checks with and without the cache")
+    bench_parser.add_argument("--requests", type=int, default=100000)
+    bench_parser.add_argument("--tokens", type=int, default=1000, help="distinct users cycling through the requests")
+    args = parser.parse_args()
+    bench(args.requests, args.tokens)
+
+if __name__ == "__main__":
+    main()
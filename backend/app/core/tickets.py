@@ -0,0 +1,162 @@
+import hashlib
+import heapq
+import hmac
+import logging
+import secrets
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Dict, List, Tuple
+from sqlalchemy import delete
+from .config import settings
+from .backplane import RedisBackplane
+from .websocket import manager
+from ..db.models import WebSocketToken
+from ..db.session import AsyncSessionLocal
+
+logger = logging.getLogger("tickets")
+
+
+class TicketError(Exception):
+    pass
+
+
+def _b64encode(data: bytes) -> str:
+    return urlsafe_b64encode(data).decode().rstrip("=")
+
+def _b64decode(data: str) -> bytes:
+    return urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class ReplayRegistry:
+    """Single-use check for ticket nonces, kept in memory until they expire.
+
+    Bounded at `max_entries`: expired nonces are evicted first, and if the
+    registry is still full new tickets are refused rather than forgetting a
+    live nonce, which would make it replayable.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._nonces: Dict[str, float] = {}
+        self._expiries: List[Tuple[float, str]] = []
+
+    async def claim(self, nonce: str, expires_at: float) -> bool:
+        self._evict(time.time())
+        if nonce in self._nonces:
+            return False
+        if len(self._nonces) >= self.max_entries:
+            raise TicketError("Too many pending tickets")
+        self._nonces[nonce] = expires_at
+        heapq.heappush(self._expiries, (expires_at, nonce))
+        return True
+
+    def __len__(self):
+        return len(self._nonces)
+
+    def _evict(self, now: float):
+        while self._expiries and self._expiries[0][0] <= now:
+            _, nonce = heapq.heappop(self._expiries)
+            self._nonces.pop(nonce, None)
+
+
+class SharedReplayRegistry:
+    """Single-use check shared by all workers, as SET NX keys on the backplane's Redis."""
+
+    def __init__(self, backplane: RedisBackplane, prefix: str = "ws-ticket:"):
+        self.backplane = backplane
+        self.prefix = prefix
+
+    async def claim(self, nonce: str, expires_at: float) -> bool:
+        ttl = max(int(expires_at - time.time()) + 1, 1)
+        try:
+            reply = await self.backplane.command("SET", self.prefix + nonce, "1", "NX", "EX", ttl)
+        except Exception as e:
+            # Fail closed: without the shared check a ticket could be replayed on another worker
+            logger.error(f"Replay check failed: {e}")
+            raise TicketError("Ticket check unavailable")
+        return reply == "OK"
+
+    def __len__(self):
+        return 0
+
+
+class TicketService:
+    """Short-lived, single-use WebSocket tickets that need no database.
+
+    A ticket is `<payload>.<signature>`, where the payload carries the user
+    id, the expiry and a random nonce, and the signature is an HMAC-SHA256
+    over it. Redeeming checks the signature and expiry, then claims the
+    nonce in the replay registry so the ticket only works once.
+    """
+
+    def __init__(self, secret: str, ttl: int, registry):
+        # Derive a separate key so a ticket can never pass as a JWT or vice versa
+        self._key = hmac.new(secret.encode(), b"ws-ticket", hashlib.sha256).digest()
+        self.ttl = ttl
+        self.registry = registry
+        self.issued = 0
+        self.redeemed = 0
+        self.rejected = 0
+
+    def issue(self, user_id: int) -> str:
+        expires_at = int(time.time()) + self.ttl
+        payload = _b64encode(f"{user_id}:{expires_at}:{secrets.token_hex(16)}".encode())
+        self.issued += 1
+        return f"{payload}.{self._sign(payload)}"
+
+    async def redeem(self, ticket: str) -> int:
+        try:
+            payload, signature = ticket.split(".")
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                raise TicketError("Invalid ticket signature")
+            user_id, expires_at, nonce = _b64decode(payload).decode().split(":")
+            user_id, expires_at = int(user_id), int(expires_at)
+        except TicketError:
+            self.rejected += 1
+            raise
+        except ValueError:
+            self.rejected += 1
+            raise TicketError("Malformed ticket")
+
+        if expires_at <= time.time():
+            self.rejected += 1
+            raise TicketError("Ticket expired")
+        if not await self.registry.claim(nonce, expires_at):
+            self.rejected += 1
+            raise TicketError("Ticket already used")
+        self.redeemed += 1
+        return user_id
+
+    def stats(self) -> dict:
+        return {
+            "issued": self.issued,
+            "redeemed": self.redeemed,
+            "rejected": self.rejected,
+            "pending": len(self.registry),
+        }
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self._key, payload.encode(), hashlib.sha256).digest())
+
+
+def create_registry():
+    mode = settings.WS_TICKET_REPLAY
+    if mode == "auto":
+        mode = "shared" if isinstance(manager.backplane, RedisBackplane) else "local"
+    if mode == "shared":
+        if not isinstance(manager.backplane, RedisBackplane):
+            raise ValueError("WS_TICKET_REPLAY=shared requires BACKPLANE_URL")
+        return SharedReplayRegistry(manager.backplane)
+    return ReplayRegistry(settings.WS_TICKET_MAX_PENDING)
+
+
+tickets = TicketService(settings.JWT_SECRET, settings.WS_TICKET_TTL, create_registry())
+
+
+async def sweep_legacy_tokens():
+    """Clear the web_socket_tokens rows left over from database-backed tokens."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(delete(WebSocketToken))
+        await db.commit()
+    if result.rowcount:
+        logger.info(f"Removed {result.rowcount} legacy WebSocket tokens")
@@ -0,0 +1,104 @@
+import logging
+import random
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from uuid import uuid4
+from .config import settings
+
+logger = logging.getLogger("trace")
+
+
+class Trace:
+    """Timed spans for one unit of work, such as a chat turn, logged as one record.
+
+    Spans are always timed, which costs two perf_counter calls each; whether
+    the trace is written is only decided when it finishes: a
+    TRACE_SAMPLE_RATE share of traces, plus every trace slower than
+    TRACE_SLOW_MS. A span entered more than once (like one broadcast per
+    streamed chunk) is reported once, with its total time and a count.
+    """
+
+    def __init__(self, name: str, started: Optional[float] = None, **attrs):
+        self.trace_id = uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter() if started is None else started
+        # name -> [start offset ms, total ms, count], in the order first entered
+        self.spans: Dict[str, List[float]] = {}
+        self.finished = False
+
+    def span(self, name: str) -> "_Span":
+        return _Span(self, name)
+
+    def record(self, name: str, started: float, ended: float):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [(started - self.started) * 1000, (ended - started) * 1000, 1]
+        else:
+            span[1] += (ended - started) * 1000
+            span[2] += 1
+
+    def finish(self, **attrs):
+        if self.finished:
+            return
+        self.finished = True
+        self.attrs.update(attrs)
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        if duration_ms >= settings.TRACE_SLOW_MS or random.random() < settings.TRACE_SAMPLE_RATE:
+            logger.info(f"{self.name} took {duration_ms:.1f} ms", extra={"trace": self.to_dict(duration_ms)})
+
+    def to_dict(self, duration_ms: float) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round(duration_ms, 2),
+            **self.attrs,
+            "spans": [
+                {"name": name, "start_ms": round(start, 2), "duration_ms": round(total, 2), "count": count}
+                for name, (start, total, count) in self.spans.items()
+            ],
+        }
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace.record(self.name, self.started, time.perf_counter())
+
+
+_NO_SPAN = nullcontext()
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+def start_trace(name: str, started: Optional[float] = None, **attrs) -> Trace:
+    """Begin a trace and make it current for this task and the tasks it starts.
+
+    `started` backdates the trace to an earlier perf_counter reading.
+    """
+    trace = Trace(name, started, **attrs)
+    current_trace.set(trace)
+    return trace
+
+def span(name: str):
+    """Time a span of the current trace; does nothing outside a trace."""
+    trace = current_trace.get()
+    return _NO_SPAN if trace is None else _Span(trace, name)
+
+def annotate(**attrs):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.attrs.update(attrs)
+
+def trace_id() -> Optional[str]:
+    trace = current_trace.get()
+    return trace.trace_id if trace is not None else None
@@ -1,59 +1,317 @@
-from fastapi import WebSocket, WebSocketDisconnect, HTTPException
-from typing import Dict, Set
-import json
+from fastapi import WebSocket
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+from collections import OrderedDict, deque
+from uuid import uuid4
+import orjson
 import asyncio
+import logging
+import time
+from .backplane import Backplane, create_backplane
+from .heartbeat import HeartbeatService
+from .config import settings
+from . import metrics
+
+logger = logging.getLogger("websocket")
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+
+class ClientConnection:
+    """One socket with a bounded outbound queue drained by its own writer task.
+
+    Enqueueing never blocks, so a slow client only delays itself. When the
+    queue is full the overflow policy decides what happens:
+    - drop_oldest: discard the oldest queued frame
+    - coalesce: merge the new message_delta into a queued delta for the same
+      reply, falling back to drop_oldest
+    - disconnect: close the socket so the client reconnects
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, max_queue: int, overflow_policy: str, on_close):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        self.websocket = websocket
+        self.user_id = user_id
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.queue: Deque[dict] = deque()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.last_send_ms = 0.0
+        self.max_send_ms = 0.0
+        self.avg_send_ms = 0.0
+        # Any inbound frame, pongs included, proves the client is still there
+        self.last_seen = time.monotonic()
+        self._on_close = on_close
+        self._ready = asyncio.Event()
+        self._closing = False
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, message: dict):
+        if self._closing:
+            return
+        if len(self.queue) >= self.max_queue and not self._handle_overflow(message):
+            return
+        self.queue.append(message)
+        self._ready.set()
+
+    def close(self):
+        self._closing = True
+        self._writer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "queue_depth": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "last_send_ms": round(self.last_send_ms, 2),
+            "avg_send_ms": round(self.avg_send_ms, 2),
+            "max_send_ms": round(self.max_send_ms, 2),
+        }
+
+    def _handle_overflow(self, message: dict) -> bool:
+        """Make room for `message`; returns False if it was absorbed or the socket is closing."""
+        if self.overflow_policy == "disconnect":
+            logger.warning(f"Closing slow consumer for user {self.user_id}: {len(self.queue)} frames queued")
+            self._closing = True
+            self._writer.cancel()
+            asyncio.create_task(self._close_socket(code=1013))
+            return False
+
+        if self.overflow_policy == "coalesce" and message.get("type") == "message_delta":
+            for index in range(len(self.queue) - 1, -1, -1):
+                queued = self.queue[index]
+                if queued.get("reply_to") == message.get("reply_to") and queued.get("thread_id") == message.get("thread_id"):
+                    if queued.get("type") == "message_delta":
+                        # Frames may be shared between sockets, so replace rather than mutate
+                        self.queue[index] = {**queued, "delta": queued["delta"] + message["delta"]}
+                        self.coalesced += 1
+                        return False
+                    break
+
+        self.queue.popleft()
+        self.dropped += 1
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                message = self.queue.popleft()
+                started = time.perf_counter()
+                await self.websocket.send_text(orjson.dumps(message).decode())
+                elapsed = (time.perf_counter() - started) * 1000
+                metrics.ws_frames_sent.inc()
+                metrics.ws_send_seconds.observe(elapsed / 1000)
+                self.sent += 1
+                self.last_send_ms = elapsed
+                self.max_send_ms = max(self.max_send_ms, elapsed)
+                self.avg_send_ms = elapsed if self.sent == 1 else self.avg_send_ms * 0.9 + elapsed * 0.1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Send to user {self.user_id} failed: {e}")
+            self._closing = True
+            await self._on_close(self.websocket, self.user_id)
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+        await self._on_close(self.websocket, self.user_id)
+
+
+class UserHistory:
+    """Sequence counter and ring buffer of the frames recently broadcast to one user."""
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.frames: Deque[dict] = deque(maxlen=size)
+
+    def record(self, message: dict) -> dict:
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        self.frames.append(message)
+        return message
+
+    def since(self, last_seq: int) -> Optional[List[dict]]:
+        """Frames after `last_seq`, or None if some of them already rolled out of the buffer."""
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.frames or self.frames[0]["seq"] > last_seq + 1:
+            return None
+        return [frame for frame in self.frames if frame["seq"] > last_seq]
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
-        self.ping_interval = 30  # seconds
+    """Local sockets per user, fan-out through the backplane, and session resume.
+
+    Every frame broadcast to a user gets the next number in that user's
+    sequence and is kept in a bounded ring buffer. A new socket is greeted
+    with a `session` frame holding this worker's epoch and the current seq.
+    A client that reconnects with the epoch and the last seq it saw gets
+    only the frames it missed. If the buffer no longer covers the gap, or
+    the client lands on another worker (different epoch), the caller's
+    `load_missed` loads the missed messages from the database instead.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None):
+        # Sockets connected to this worker only; other workers are reached through the backplane
+        self.active_connections: Dict[int, Dict[WebSocket, ClientConnection]] = {}
+        self.epoch = uuid4().hex[:12]
+        self.history_size = settings.WS_RESUME_BUFFER
+        self.max_histories = settings.WS_RESUME_USERS
+        self._histories: "OrderedDict[int, UserHistory]" = OrderedDict()
+        self.resumed_replay = 0
+        self.resumed_db = 0
+        self.send_queue_size = settings.WS_SEND_QUEUE_SIZE
+        self.overflow_policy = settings.WS_OVERFLOW_POLICY
+        self.backplane = backplane or create_backplane()
+        self.heartbeat = HeartbeatService(
+            self._reap,
+            interval=settings.WS_PING_INTERVAL,
+            timeout=settings.WS_PONG_TIMEOUT,
+            tick=settings.WS_HEARTBEAT_TICK
+        )
 
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def start(self):
+        await self.backplane.start(self.deliver_local)
+        self.heartbeat.start()
+
+    async def stop(self):
+        await self.heartbeat.stop()
+        await self.backplane.stop()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        resume: Optional[dict] = None,
+        load_missed: Optional[Callable[[], Awaitable[List[dict]]]] = None
+    ):
+        """Accept the socket; with `resume` ({"epoch", "last_seq"}) queue what the client missed first."""
         await websocket.accept()
+        history = self._history(user_id)
+        backlog: List[dict] = []
+        mode = None
+        if resume is not None:
+            replay = history.since(resume["last_seq"]) if resume.get("epoch") == self.epoch else None
+            if replay is not None:
+                backlog, mode = replay, "replay"
+                self.resumed_replay += 1
+            elif load_missed is not None:
+                mark = history.seq
+                backlog = await load_missed()
+                # Frames broadcast while the query ran; the client drops duplicates by message_id
+                backlog += history.since(mark) or []
+                mode = "database"
+                self.resumed_db += 1
+
+        # No awaits from here on, so nothing broadcast now can overtake the backlog
         if user_id not in self.active_connections:
-            self.active_connections[user_id] = set()
-        self.active_connections[user_id].add(websocket)
-        print(f"User {user_id} connected.")
-        # Start ping-pong
-        asyncio.create_task(self._ping_client(websocket, user_id))
+            self.active_connections[user_id] = {}
+        connection = ClientConnection(
+            websocket, user_id, self.send_queue_size, self.overflow_policy, self.disconnect
+        )
+        connection.enqueue({"type": "session", "epoch": self.epoch, "seq": history.seq, "resumed": mode})
+        for message in backlog:
+            connection.enqueue(message)
+        self.active_connections[user_id][websocket] = connection
+        self.heartbeat.add(connection)
+        logger.info(f"User {user_id} connected")
 
     async def disconnect(self, websocket: WebSocket, user_id: int):
         try:
             if user_id in self.active_connections:
-                self.active_connections[user_id].remove(websocket)
+                connection = self.active_connections[user_id].pop(websocket, None)
+                if connection is not None:
+                    connection.close()
+                    self.heartbeat.remove(connection)
                 if not self.active_connections[user_id]:
                     del self.active_connections[user_id]
-                    print(f"User {user_id} disconnected.")
+                    logger.info(f"User {user_id} disconnected")
         except Exception as e:
-            print(f"User {user_id} disconnected because of an error: {e}")
+            logger.error(f"User {user_id} disconnected because of an error: {e}")
 
-    async def _ping_client(self, websocket: WebSocket, user_id: int):
-        try:
-            while True:
-                try:
-                    await asyncio.sleep(self.ping_interval)
-                    if websocket.client_state.CONNECTED:
-                        await websocket.send_json({"type": "ping"})
-                except WebSocketDisconnect:
-                        break
-        except Exception as e:
-            print(f"User {user_id} disconnected because of an error: {e}")
-        finally:
+    def touch(self, websocket: WebSocket, user_id: int):
+        """Record inbound traffic (usually a pong) so the heartbeat keeps the socket."""
+        connection = self.active_connections.get(user_id, {}).get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    async def close_user(self, user_id: int, code: int = 1008):
+        """Close all of a user's sockets on this worker."""
+        for websocket in list(self.active_connections.get(user_id, {})):
             await self.disconnect(websocket, user_id)
+            try:
+                await websocket.close(code=code)
+            except Exception:
+                pass
+
+    async def _reap(self, connection: ClientConnection):
+        logger.info(f"Closing unresponsive socket for user {connection.user_id}")
+        await self.disconnect(connection.websocket, connection.user_id)
+        try:
+            await connection.websocket.close(code=1001)
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, user_id: int, message: dict):
+        """Queue a frame for a single socket owned by this worker."""
+        connection = self.active_connections.get(user_id, {}).get(websocket)
+        if connection is not None:
+            connection.enqueue(message)
 
     async def broadcast_to_user(self, message: dict, user_id: int):
-        if user_id in self.active_connections:
-            dead_connections = set()
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                    print(f"Sent message: {message} to user {user_id}")
-                except Exception:
-                    dead_connections.add(connection)
-            
-            # Clean up dead connections
-            for dead in dead_connections:
-                await self.disconnect(dead, user_id)
-
-manager = ConnectionManager()
\ No newline at end of file
+        await self.backplane.publish(user_id, message)
+
+    async def deliver_local(self, user_id: int, messages: List[dict]):
+        # Each worker numbers the frames it delivers, so seqs are only comparable within one epoch
+        history = self._history(user_id)
+        messages = [history.record(message) for message in messages]
+        # Each socket has its own writer, so fan-out only queues frames
+        for connection in list(self.active_connections.get(user_id, {}).values()):
+            for message in messages:
+                connection.enqueue(message)
+
+    def _history(self, user_id: int) -> UserHistory:
+        history = self._histories.get(user_id)
+        if history is None:
+            history = self._histories[user_id] = UserHistory(self.history_size)
+            if len(self._histories) > self.max_histories:
+                self._histories.popitem(last=False)
+        else:
+            self._histories.move_to_end(user_id)
+        return history
+
+    def stats(self) -> dict:
+        connections = [
+            connection.stats()
+            for user_connections in self.active_connections.values()
+            for connection in user_connections.values()
+        ]
+        return {
+            "users": len(self.active_connections),
+            "connections": len(connections),
+            "queued_frames": sum(c["queue_depth"] for c in connections),
+            "dropped_frames": sum(c["dropped"] for c in connections),
+            "heartbeat": self.heartbeat.stats(),
+            "resume": {
+                "epoch": self.epoch,
+                "histories": len(self._histories),
+                "replayed": self.resumed_replay,
+                "from_database": self.resumed_db,
+            },
+            "slowest": sorted(connections, key=lambda c: c["avg_send_ms"], reverse=True)[:10],
+        }
+
+manager = ConnectionManager()
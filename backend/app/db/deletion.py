@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import delete, exists, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from .models import AccountDeletion, Message, Thread, ThreadActivity, ThreadContext, User, UserStats, WebSocketToken
+from .session import async_engine
+from ..core.config import settings
+from ..core.context import context_builder
+from ..core.security import revoke_user
+
+logger = logging.getLogger("deletion")
+
+
+class AccountDeleter:
+    """Deletes accounts in the background, a bounded batch per transaction.
+
+    `request` records the deletion in account_deletions and returns. The job
+    then deletes the user's messages `batch_size` at a time, then their
+    threads once they are empty (a reply saved in the meantime is deleted
+    first rather than orphaned), and finally the user row. Each batch commits
+    together with the progress counters on its account_deletions row, so the
+    writer connection is only held for one batch and a restart resumes where
+    the last commit left off.
+
+    The table is re-read every `poll_seconds`: that picks up deletions
+    requested on other workers and revokes those users' tokens here too.
+    """
+
+    def __init__(self, engine: AsyncEngine, batch_size: int, pause_ms: float, poll_seconds: float):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+        self.poll_seconds = poll_seconds
+        self.pending = 0
+        self.accounts = 0
+        self.messages = 0
+        self.threads = 0
+        self.batches = 0
+        self.batch_seconds_max = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        """Revoke the users in account_deletions, then resume unfinished deletions in the background."""
+        if self._task is None:
+            await self._load()
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop after the batch in progress; the rest resumes on the next start."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+    async def request(self, user_id: int):
+        async with self.engine.connect() as conn:
+            requested = (await conn.execute(
+                select(AccountDeletion.user_id).filter(AccountDeletion.user_id == user_id)
+            )).first()
+            if requested is None:
+                await conn.execute(insert(AccountDeletion).values(user_id=user_id, requested_at=datetime.utcnow()))
+                await conn.commit()
+        revoke_user(user_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "accounts": self.accounts,
+            "messages": self.messages,
+            "threads": self.threads,
+            "batches": self.batches,
+            "batch_seconds_max": round(self.batch_seconds_max, 4),
+        }
+
+    async def _load(self) -> List[int]:
+        """Revoke every user in account_deletions; returns the ones not deleted yet, oldest first."""
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(
+                select(AccountDeletion.user_id, AccountDeletion.completed_at).order_by(AccountDeletion.requested_at)
+            )).all()
+        for row in rows:
+            revoke_user(row.user_id)
+        pending = [row.user_id for row in rows if row.completed_at is None]
+        self.pending = len(pending)
+        return pending
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                for user_id in await self._load():
+                    if self._stopping:
+                        break
+                    await self._delete(user_id)
+            except Exception as e:
+                logger.error(f"Account deletion failed, retrying in {self.poll_seconds}s: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _delete(self, user_id: int):
+        logger.info(f"Deleting account {user_id}")
+        started = time.monotonic()
+        while not self._stopping:
+            # Messages first; a thread only goes once it is empty
+            if await self._batch(user_id, self._delete_messages):
+                continue
+            if await self._batch(user_id, self._delete_threads):
+                continue
+            await self._batch(user_id, self._delete_user)
+            self.pending -= 1
+            self.accounts += 1
+            logger.info(f"Deleted account {user_id} in {time.monotonic() - started:.1f}s")
+            return
+
+    async def _batch(self, user_id: int, step) -> int:
+        started = time.perf_counter()
+        async with self.engine.connect() as conn:
+            threads, messages = await step(conn, user_id)
+            values = {"updated_at": datetime.utcnow()}
+            if threads:
+                values["threads_deleted"] = AccountDeletion.threads_deleted + threads
+            if messages:
+                values["messages_deleted"] = AccountDeletion.messages_deleted + messages
+            await conn.execute(update(AccountDeletion).filter(AccountDeletion.user_id == user_id).values(**values))
+            await conn.commit()
+        self.batches += 1
+        self.threads += threads
+        self.messages += messages
+        self.batch_seconds_max = max(self.batch_seconds_max, time.perf_counter() - started)
+        # Let queued writers have the connection before the next batch
+        await asyncio.sleep(self.pause)
+        return threads + messages
+
+    async def _delete_messages(self, conn: AsyncConnection, user_id: int):
+        ids = (
+            select(Message.id)
+            .filter(Message.thread_id.in_(select(Thread.id).filter(Thread.user_id == user_id)))
+            .limit(self.batch_size)
+        )
+        result = await conn.execute(delete(Message).filter(Message.id.in_(ids)))
+        return 0, result.rowcount
+
+    async def _delete_threads(self, conn: AsyncConnection, user_id: int):
+        ids = (await conn.execute(
+            select(Thread.id)
+            .filter(Thread.user_id == user_id, ~exists().where(Message.thread_id == Thread.id))
+            .limit(self.batch_size)
+        )).scalars().all()
+        if not ids:
+            return 0, 0
+        await conn.execute(delete(ThreadContext).filter(ThreadContext.thread_id.in_(ids)))
+        await conn.execute(delete(ThreadActivity).filter(ThreadActivity.thread_id.in_(ids)))
+        result = await conn.execute(delete(Thread).filter(Thread.id.in_(ids)))
+        for thread_id in ids:
+            context_builder.forget(thread_id)
+        return result.rowcount, 0
+
+    async def _delete_user(self, conn: AsyncConnection, user_id: int):
+        await conn.execute(delete(WebSocketToken).filter(WebSocketToken.user_id == user_id))
+        await conn.execute(delete(UserStats).filter(UserStats.user_id == user_id))
+        await conn.execute(delete(User).filter(User.id == user_id))
+        await conn.execute(
+            update(AccountDeletion).filter(AccountDeletion.user_id == user_id).values(completed_at=datetime.utcnow())
+        )
+        return 0, 0
+
+
+account_deleter = AccountDeleter(
+    async_engine,
+    batch_size=settings.ACCOUNT_DELETE_BATCH,
+    pause_ms=settings.ACCOUNT_DELETE_PAUSE_MS,
+    poll_seconds=settings.ACCOUNT_DELETE_POLL_SECONDS
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or finish background account deletions")
+    parser.add_argument("command", choices=["status", "run"])
+    args = parser.parse_args()
+
+    from .session import init_db_async
+
+    async def run():
+        await init_db_async()
+        if args.command == "run":
+            for user_id in await account_deleter._load():
+                await account_deleter._delete(user_id)
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(select(AccountDeletion).order_by(AccountDeletion.requested_at))).all()
+        for row in rows:
+            state = f"completed {row.completed_at}" if row.completed_at else "pending"
+            print(f"user {row.user_id}: {row.threads_deleted} threads, {row.messages_deleted} messages, {state}")
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
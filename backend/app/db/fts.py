@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+# Full-text search over messages.content via the messages_fts FTS5 table.
+# script.sql creates the table and the triggers that keep it in sync; the
+# functions here answer queries and (re)build the index for existing data.
+
+BACKFILL_BATCH = 50000
+SNIPPET_TOKENS = 12
+
+SEARCH_SQL = """
+SELECT m.id, m.thread_id, t.title, m.is_bot, m.created_at,
+       snippet(messages_fts, 0, '**', '**', '…', :tokens) AS snippet,
+       bm25(messages_fts, 1.0, 0.0) AS rank
+FROM messages_fts
+JOIN messages m ON m.id = messages_fts.rowid
+JOIN threads t ON t.id = m.thread_id
+WHERE messages_fts MATCH :match
+ORDER BY rank
+LIMIT :limit OFFSET :offset
+"""
+
+BACKFILL_SQL = """
+INSERT INTO messages_fts (rowid, content, owner, thread_id)
+SELECT m.id, m.content, 'u' || t.user_id, m.thread_id
+FROM messages m JOIN threads t ON t.id = m.thread_id
+WHERE m.id > :after AND m.id <= :upto
+"""
+
+def match_query(query: str, user_id: int) -> Optional[str]:
+    """Build an FTS5 MATCH expression for a user's free-text query.
+
+    Every term is quoted so FTS5 operators in the input are searched
+    literally; a trailing * keeps prefix search. Terms are ANDed and the
+    owner column restricts matches to the user's own messages.
+    """
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"' + ("*" if prefix else ""))
+    if not terms:
+        return None
+    return f"owner:u{user_id} AND content:({' '.join(terms)})"
+
+async def search(db: AsyncSession, user_id: int, query: str, limit: int, offset: int) -> List[dict]:
+    match = match_query(query, user_id)
+    if match is None:
+        return []
+    rows = await db.execute(text(SEARCH_SQL), {
+        "match": match,
+        "tokens": SNIPPET_TOKENS,
+        "limit": limit,
+        "offset": offset
+    })
+    return [
+        {
+            "message_id": row.id,
+            "thread_id": row.thread_id,
+            "thread_title": row.title,
+            "is_bot": bool(row.is_bot),
+            "created_at": row.created_at,
+            "snippet": row.snippet,
+            "rank": row.rank
+        }
+        for row in rows
+    ]
+
+async def backfill(engine: AsyncEngine) -> int:
+    """Index messages newer than the highest indexed id, in committed batches."""
+    indexed = 0
+    async with engine.connect() as conn:
+        after = (await conn.execute(text("SELECT coalesce(max(rowid), 0) FROM messages_fts"))).scalar()
+        last = (await conn.execute(text("SELECT coalesce(max(id), 0) FROM messages"))).scalar()
+        while after < last:
+            upto = after + BACKFILL_BATCH
+            result = await conn.execute(text(BACKFILL_SQL), {"after": after, "upto": upto})
+            await conn.commit()
+            indexed += result.rowcount
+            after = upto
+    return indexed
+
+async def rebuild(engine: AsyncEngine) -> int:
+    """Drop the whole index and build it again from messages."""
+    async with engine.connect() as conn:
+        await conn.execute(text("DELETE FROM messages_fts"))
+        await conn.commit()
+    indexed = await backfill(engine)
+    async with engine.connect() as conn:
+        await conn.execute(text("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')"))
+        await conn.commit()
+    return indexed
+
+WORDS = (
+    "python async database index query cache stream token thread message user server "
+    "client socket latency deploy docker test error retry timeout config schema migration "
+    "search ranking snippet gemini prompt reply summary context budget window batch commit"
+).split()
+
+def bench(messages: int, users: int, queries: int, seed: int = 0):
+    """Time searches on a generated corpus in a throwaway SQLite database."""
+    rng = random.Random(seed)
+    vocabulary = WORDS + [f"term{i}" for i in range(5000)]
+    path = os.path.join(tempfile.mkdtemp(), "fts_bench.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    with open("script.sql") as f:
+        conn.executescript(f.read())
+    conn.executemany(
+        "INSERT INTO users (id, name, email, auth_provider, provider_user_id) VALUES (?, ?, ?, 'google', ?)",
+        [(i, f"user{i}", f"user{i}@example.com", str(i)) for i in range(1, users + 1)]
+    )
+    threads = max(users * 10, 1)
+    conn.executemany(
+        "INSERT INTO threads (id, user_id, title) VALUES (?, ?, ?)",
+        [(i, (i - 1) % users + 1, f"thread {i}") for i in range(1, threads + 1)]
+    )
+    started = time.perf_counter()
+    batch = []
+    for i in range(messages):
+        content = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(5, 60)))
+        batch.append((rng.randint(1, threads), content, i % 2))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO messages (thread_id, content, is_bot) VALUES (?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO messages (thread_id, content, is_bot) VALUES (?, ?, ?)", batch)
+    conn.commit()
+    print(f"Indexed {messages} messages for {users} users in {time.perf_counter() - started:.1f}s")
+
+    sql = SEARCH_SQL.replace(":tokens", str(SNIPPET_TOKENS))
+    timings = []
+    for _ in range(queries):
+        terms = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        match = match_query(terms, rng.randint(1, users))
+        started = time.perf_counter()
+        conn.execute(sql, {"match": match, "limit": 20, "offset": 0}).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(
+        f"{queries} queries: p50 {timings[len(timings) // 2]:.2f}ms "
+        f"p95 {timings[int(len(timings) * 0.95)]:.2f}ms max {timings[-1]:.2f}ms"
+    )
+    conn.close()
+    os.remove(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the message search index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="rebuild the index from scratch")
+    commands.add_parser("backfill", help="index messages that are not indexed yet")
+    bench_parser = commands.add_parser("bench", help="time searches on a generated corpus")
+    bench_parser.add_argument("--messages", type=int, default=1000000)
+    bench_parser.add_argument("--users", type=int, default=1000)
+    bench_parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.messages, args.users, args.queries)
+        return
+
+    from .session import async_engine, init_db_async
+
+    async def run():
+        await init_db_async()
+        indexed = await (rebuild if args.command == "rebuild" else backfill)(async_engine)
+        print(f"Indexed {indexed} messages")
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Enum, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Enum, Boolean, Index
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 import enum
@@ -25,6 +25,8 @@ class User(Base):
 
 class Thread(Base):
     __tablename__ = "threads"
+    # Keyset pagination of a user's threads; same index as script.sql
+    __table_args__ = (Index("idx_threads_user_created", "user_id", "created_at", "id"),)
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -37,6 +39,7 @@ class Thread(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("idx_messages_thread_id", "thread_id", "id"),)
     
     id = Column(Integer, primary_key=True)
     thread_id = Column(Integer, ForeignKey("threads.id"))
@@ -47,6 +50,46 @@ class Message(Base):
     # Relationships
     thread = relationship("Thread", back_populates="messages")
 
+class ThreadContext(Base):
+    __tablename__ = "thread_contexts"
+
+    # Rolling LLM summary of the turns that no longer fit in the prompt window
+    thread_id = Column(Integer, ForeignKey("threads.id"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    summarized_upto_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class ThreadActivity(Base):
+    __tablename__ = "thread_activity"
+    __table_args__ = (Index("idx_thread_activity_user", "user_id", "last_activity_at", "thread_id"),)
+
+    # Maintained by triggers in script.sql; never written by the app
+    thread_id = Column(Integer, ForeignKey("threads.id"), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False, default=0)
+    last_message_id = Column(Integer)
+    last_message_at = Column(DateTime)
+    last_message_preview = Column(String(200))
+    last_activity_at = Column(DateTime, nullable=False)
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    # Maintained by triggers in script.sql; never written by the app
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    thread_count = Column(Integer, nullable=False, default=0)
+
+class AccountDeletion(Base):
+    __tablename__ = "account_deletions"
+
+    # Progress of a background account deletion; kept once completed so the user's tokens stay refused
+    user_id = Column(Integer, primary_key=True, autoincrement=False)
+    requested_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    threads_deleted = Column(Integer, nullable=False, default=0)
+    messages_deleted = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
 class WebSocketToken(Base):
     __tablename__ = 'web_socket_tokens'
     id = Column(Integer, primary_key=True, index=True)
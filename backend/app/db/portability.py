@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+import orjson
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from .models import AuthProvider, Message, Thread, User
+from .session import AsyncReadSessionLocal, async_engine, init_db_async
+
+# NDJSON account export and import. An export is one `export` header line,
+# then each thread as a `thread` line followed by its `message` lines:
+#   {"type": "export", "version": 1, "user": {...}, "exported_at": "..."}
+#   {"type": "thread", "id": 7, "title": "...", "created_at": "..."}
+#   {"type": "message", "thread_id": 7, "content": "...", "is_bot": false, "created_at": "..."}
+
+EXPORT_VERSION = 1
+EXPORT_PAGE_ROWS = 1000
+EXPORT_CHUNK_LINES = 500
+IMPORT_BATCH = 1000
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _line(record: dict) -> bytes:
+    return orjson.dumps(record) + b"\n"
+
+def _time(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+async def _message_pages(thread_ids: List[int]) -> AsyncIterator:
+    """Yield the messages of `thread_ids` in (thread_id, id) order, one short-lived session per page."""
+    after = (thread_ids[0] - 1, 0)
+    while True:
+        async with AsyncReadSessionLocal() as db:
+            rows = (await db.execute(
+                select(Message.id, Message.thread_id, Message.content, Message.is_bot, Message.created_at)
+                .filter(Message.thread_id.in_(thread_ids), tuple_(Message.thread_id, Message.id) > after)
+                .order_by(Message.thread_id, Message.id)
+                .limit(EXPORT_PAGE_ROWS)
+            )).all()
+        for row in rows:
+            yield row
+        if len(rows) < EXPORT_PAGE_ROWS:
+            return
+        after = (rows[-1].thread_id, rows[-1].id)
+
+async def export_ndjson(user_id: int) -> AsyncIterator[bytes]:
+    """Yield the user's account as NDJSON chunks.
+
+    Threads and messages are read in keyset pages of EXPORT_PAGE_ROWS, each
+    in its own session, so a slow client never holds a reader connection.
+    """
+    async with AsyncReadSessionLocal() as db:
+        user = (await db.execute(
+            select(User.name, User.email, User.image_url, User.created_at).filter(User.id == user_id)
+        )).first()
+    yield _line({
+        "type": "export",
+        "version": EXPORT_VERSION,
+        "user": {"name": user.name, "email": user.email, "image_url": user.image_url, "created_at": _time(user.created_at)} if user else None,
+        "exported_at": datetime.utcnow().isoformat()
+    })
+
+    chunk: List[bytes] = []
+    after_thread = 0
+    while True:
+        async with AsyncReadSessionLocal() as db:
+            threads = (await db.execute(
+                select(Thread.id, Thread.title, Thread.created_at)
+                .filter(Thread.user_id == user_id, Thread.id > after_thread)
+                .order_by(Thread.id)
+                .limit(EXPORT_PAGE_ROWS)
+            )).all()
+        if not threads:
+            break
+        after_thread = threads[-1].id
+        messages = _message_pages([thread.id for thread in threads])
+        message = await anext(messages, None)
+        for thread in threads:
+            chunk.append(_line({"type": "thread", "id": thread.id, "title": thread.title, "created_at": _time(thread.created_at)}))
+            while message is not None and message.thread_id == thread.id:
+                chunk.append(_line({
+                    "type": "message",
+                    "thread_id": thread.id,
+                    "content": message.content,
+                    "is_bot": bool(message.is_bot),
+                    "created_at": _time(message.created_at)
+                }))
+                if len(chunk) >= EXPORT_CHUNK_LINES:
+                    yield b"".join(chunk)
+                    chunk = []
+                message = await anext(messages, None)
+        if chunk:
+            yield b"".join(chunk)
+            chunk = []
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+def _parse_time(value: Optional[str]) -> datetime:
+    return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+def _field(record: dict, name: str, kind, required: bool = True):
+    if name not in record:
+        if required:
+            raise ImportFormatError(f"{record['type']} record is missing {name}")
+        return None
+    if not isinstance(record[name], kind):
+        raise ImportFormatError(f"{record['type']} record has an invalid {name}")
+    return record[name]
+
+async def import_ndjson(user_id: int, chunks: AsyncIterator[bytes], batch_size: int = IMPORT_BATCH) -> Dict[str, int]:
+    """Add the threads and messages of an NDJSON export to `user_id`'s account.
+
+    Threads get new ids; messages are inserted in batches of `batch_size`,
+    each batch in its own transaction so live writes can interleave.
+    """
+    thread_ids: Dict[int, int] = {}
+    pending: List[dict] = []
+    counts = {"threads": 0, "messages": 0}
+
+    async def flush():
+        if pending:
+            async with async_engine.connect() as conn:
+                await conn.execute(insert(Message), pending)
+                await conn.commit()
+            counts["messages"] += len(pending)
+            pending.clear()
+
+    line_number = 0
+    async for line in _lines(chunks):
+        line_number += 1
+        try:
+            record = orjson.loads(line)
+            kind = record["type"]
+            if kind == "export":
+                if record.get("version") != EXPORT_VERSION:
+                    raise ImportFormatError(f"Unsupported export version: {record.get('version')}")
+            elif kind == "thread":
+                source_id = _field(record, "id", int)
+                title = _field(record, "title", (str, type(None)), required=False)
+                created_at = _parse_time(_field(record, "created_at", (str, type(None)), required=False))
+                # Messages queued so far belong to earlier threads; keep ids in order
+                await flush()
+                async with async_engine.connect() as conn:
+                    result = await conn.execute(
+                        insert(Thread).returning(Thread.id),
+                        {"user_id": user_id, "title": title, "created_at": created_at}
+                    )
+                    thread_ids[source_id] = result.scalar_one()
+                    await conn.commit()
+                counts["threads"] += 1
+            elif kind == "message":
+                source_id = _field(record, "thread_id", int)
+                if source_id not in thread_ids:
+                    raise ImportFormatError(f"Message for unknown thread {source_id}")
+                pending.append({
+                    "thread_id": thread_ids[source_id],
+                    "content": _field(record, "content", str),
+                    "is_bot": bool(_field(record, "is_bot", bool, required=False)),
+                    "created_at": _parse_time(_field(record, "created_at", (str, type(None)), required=False))
+                })
+                if len(pending) >= batch_size:
+                    await flush()
+            else:
+                raise ImportFormatError(f"Unknown record type: {kind}")
+        except ImportFormatError as e:
+            raise ImportFormatError(f"Line {line_number}: {e}")
+        except IntegrityError as e:
+            raise ImportFormatError(f"Line {line_number}: rejected by the database ({e.orig})")
+        except (orjson.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+            raise ImportFormatError(f"Line {line_number}: invalid record ({e})")
+    try:
+        await flush()
+    except IntegrityError as e:
+        raise ImportFormatError(f"Line {line_number}: rejected by the database ({e.orig})")
+    return counts
+
+def _rss_mb() -> float:
+    # Current anonymous resident memory. Not ru_maxrss, which never comes back
+    # down between runs, and not file-backed pages, which SQLite's mmap fills
+    with open("/proc/self/statm") as f:
+        _, resident, shared = f.read().split()[:3]
+    return (int(resident) - int(shared)) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+async def bench(sizes: List[int], messages_per_thread: int):
+    """Export and re-import generated accounts of each size in `sizes`, in the configured database.
+
+    Memory (see _rss_mb) is sampled as chunks pass, so a flat peak across sizes means the
+    streams run in constant memory; on SQLite the first large import also
+    fills the writer's page cache, up to SQLITE_CACHE_SIZE. The accounts are
+    deleted afterwards.
+    """
+    from .deletion import account_deleter
+
+    await init_db_async()
+    tag = uuid.uuid4().hex[:8]
+    for size in sizes:
+        user_ids = []
+        async with async_engine.connect() as conn:
+            for role in ("source", "target"):
+                result = await conn.execute(insert(User).returning(User.id), {
+                    "name": f"bench {role}", "email": f"bench-{role}-{size}-{tag}@example.com",
+                    "auth_provider": AuthProvider.GOOGLE, "provider_user_id": f"bench-{role}-{size}-{tag}"
+                })
+                user_ids.append(result.scalar_one())
+            await conn.commit()
+            source, target = user_ids
+            for start in range(0, size, 10000):
+                count = min(10000, size - start)
+                threads = (await conn.execute(
+                    insert(Thread).returning(Thread.id),
+                    [{"user_id": source, "title": f"thread {i}"} for i in range(start // messages_per_thread, (start + count - 1) // messages_per_thread + 1)]
+                )).scalars().all()
+                await conn.execute(insert(Message), [
+                    {"thread_id": threads[i // messages_per_thread - start // messages_per_thread], "content": f"message {i} " + "lorem ipsum dolor sit amet " * 4, "is_bot": i % 2 == 1}
+                    for i in range(start, start + count)
+                ])
+                await conn.commit()
+        try:
+            path = os.path.join(tempfile.mkdtemp(), "export.ndjson")
+            baseline = peak = _rss_mb()
+            started = time.perf_counter()
+            with open(path, "wb") as f:
+                async for chunk in export_ndjson(source):
+                    f.write(chunk)
+                    peak = max(peak, _rss_mb())
+            exported = time.perf_counter() - started
+            print(f"{size:>9} messages  export {size / exported:>9.0f} rows/s  peak +{peak - baseline:6.1f} MB  {os.path.getsize(path) / 1e6:7.1f} MB file")
+
+            async def read_file() -> AsyncIterator[bytes]:
+                nonlocal peak
+                with open(path, "rb") as f:
+                    while chunk := f.read(1 << 16):
+                        peak = max(peak, _rss_mb())
+                        yield chunk
+
+            baseline = peak = _rss_mb()
+            started = time.perf_counter()
+            counts = await import_ndjson(target, read_file())
+            imported = time.perf_counter() - started
+            assert counts["messages"] == size
+            print(f"{size:>9} messages  import {size / imported:>9.0f} rows/s  peak +{peak - baseline:6.1f} MB")
+            os.remove(path)
+        finally:
+            for user_id in user_ids:
+                await account_deleter._delete(user_id)
+    await async_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import an account as NDJSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("export", "import"):
+        command_parser = commands.add_parser(command, help=f"{command} an account")
+        command_parser.add_argument("user_id", type=int)
+        command_parser.add_argument("path", help="file to write or read; - for stdout/stdin")
+    bench_parser = commands.add_parser("bench", help="time export and import and track memory on generated accounts")
+    bench_parser.add_argument("--messages", type=int, nargs="+", default=[10000, 100000])
+    bench_parser.add_argument("--per-thread", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        asyncio.run(bench(args.messages, args.per_thread))
+        return
+
+    async def read_file(path: str) -> AsyncIterator[bytes]:
+        stream = sys.stdin.buffer if path == "-" else open(path, "rb")
+        with stream:
+            while chunk := await asyncio.to_thread(stream.read, 1 << 20):
+                yield chunk
+
+    async def run():
+        await init_db_async()
+        if args.command == "export":
+            stream = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+            with stream:
+                async for chunk in export_ndjson(args.user_id):
+                    stream.write(chunk)
+        else:
+            counts = await import_ndjson(args.user_id, read_file(args.path))
+            print(f"Imported {counts['threads']} threads and {counts['messages']} messages", file=sys.stderr)
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
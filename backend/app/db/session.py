@@ -1,47 +1,175 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import logging
+import sqlite3
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import Optional
 from ..core.config import settings
+from ..core import metrics
+from .models import Base
 
-# Create synchronous engine and session factory
-sync_engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
-SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+logger = logging.getLogger("db")
 
-# Create asynchronous engine and session factory
-async_engine = create_async_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+# Storage layer:
+# - SQLite: one writer connection (SQLite allows a single writer anyway, so queueing
+#   in-process avoids SQLITE_BUSY) and a pool of query_only readers, with WAL and
+#   the SQLITE_* pragmas applied to every new connection.
+# - Postgres: asyncpg engines with sized pools; reads can go to DATABASE_READ_URL.
+
+DRIVERS = {
+    "sqlite": ("sqlite+aiosqlite", "sqlite"),
+    "postgresql": ("postgresql+asyncpg", "postgresql"),
+}
+
+def _url(url: str, for_async: bool):
+    url = make_url(url)
+    drivers = DRIVERS.get(url.get_backend_name())
+    if drivers is None:
+        return url
+    return url.set(drivername=drivers[0] if for_async else drivers[1])
+
+def is_sqlite(url: str = settings.DATABASE_URL) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _apply_sqlite_pragmas(engine: Engine, query_only: bool = False):
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if query_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+STATEMENT_KINDS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "CREATE", "DROP", "PRAGMA"}
+
+def _statement_kind(statement: str) -> str:
+    # Only look at the first word; statements can be long
+    words = statement.lstrip()[:10].split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+def _instrument(engine: Engine, role: str):
+    """Time every statement on `engine` into the db_query_seconds histogram."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def record_timing(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is not None:
+            metrics.db_query_seconds.labels(role, _statement_kind(statement)).observe(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def record_error(context):
+        metrics.db_errors.labels(role).inc()
+
+def _create_async_engine(url: str, read_only: bool) -> AsyncEngine:
+    if is_sqlite(url):
+        engine = create_async_engine(
+            _url(url, for_async=True),
+            connect_args={"check_same_thread": False},
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.SQLITE_READ_POOL_SIZE if read_only else 1,
+            max_overflow=0,
+            pool_timeout=settings.DB_POOL_TIMEOUT
+        )
+        _apply_sqlite_pragmas(engine.sync_engine, query_only=read_only)
+    else:
+        engine = create_async_engine(
+            _url(url, for_async=True),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    _instrument(engine.sync_engine, "read" if read_only else "write")
+    return engine
+
+# Synchronous engine, created on first use so a missing sync driver only matters to sync callers
+_sync_engine: Optional[Engine] = None
+
+def get_sync_engine() -> Engine:
+    global _sync_engine
+    if _sync_engine is None:
+        if is_sqlite():
+            _sync_engine = create_engine(_url(settings.DATABASE_URL, for_async=False), connect_args={"check_same_thread": False})
+            _apply_sqlite_pragmas(_sync_engine)
+        else:
+            _sync_engine = create_engine(_url(settings.DATABASE_URL, for_async=False), pool_pre_ping=True)
+    return _sync_engine
+
+# Asynchronous writer and reader engines and session factories
+async_engine = _create_async_engine(settings.DATABASE_URL, read_only=False)
+async_read_engine = _create_async_engine(settings.DATABASE_READ_URL or settings.DATABASE_URL, read_only=True)
 AsyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=AsyncSession, bind=async_engine)
+AsyncReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=AsyncSession, bind=async_read_engine)
 
 # Synchronous get_db function
 def get_db():
-    db = SyncSessionLocal()
+    db = Session(bind=get_sync_engine(), autoflush=False)
     try:
         yield db
     finally:
         db.close()
 
-# Asynchronous get_db function
+# Asynchronous get_db function (writer)
 async def get_async_db():
     async with AsyncSessionLocal() as db:
         yield db
 
+# Asynchronous session on the read pool, for endpoints that only query
+async def get_async_read_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+def _sql_commands():
+    with open("script.sql") as f:
+        sql_commands = f.read()
+    # Split on complete statements rather than ";" so trigger bodies stay whole
+    commands, command = [], ""
+    for line in sql_commands.splitlines(keepends=True):
+        command += line
+        if sqlite3.complete_statement(command):
+            commands.append(command.strip())
+            command = ""
+    return [command for command in commands + [command.strip()] if command.strip(" ;\n")]
+
+def _create_schema(connection):
+    Base.metadata.create_all(connection)
+    # create_all skips existing tables, and with them any index added to the models since
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
 # Initialize database tables if they do not exist
 def init_db():
-    with sync_engine.connect() as connection:
-        with open("script.sql") as f:
-            sql_commands = f.read()
-        for command in sql_commands.split(";"):
-            if command.strip():
-                connection.execute(text(command))
+    engine = get_sync_engine()
+    if not is_sqlite():
+        with engine.begin() as connection:
+            _create_schema(connection)
+        return
+    with engine.connect() as connection:
+        for command in _sql_commands():
+            connection.execute(text(command))
         connection.commit()
 
 async def init_db_async():
-    print("Initializing database")
+    logger.info("Initializing database")
     async with async_engine.connect() as connection:
-        with open("script.sql") as f:
-            sql_commands = f.read()
-        for command in sql_commands.split(";"):
-            if command.strip():
+        if not is_sqlite():
+            # script.sql is written for SQLite; other backends get the schema from the models
+            await connection.run_sync(_create_schema)
+        else:
+            for command in _sql_commands():
                 await connection.execute(text(command))
         await connection.commit()
-
-# Call init_db to initialize tables
\ No newline at end of file
@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# thread_activity and user_stats are kept current by the triggers in
+# script.sql. The functions here fill them in for rows written before the
+# triggers existed, or recompute them from scratch.
+
+BACKFILL_BATCH = 10000
+
+BACKFILL_SQL = """
+INSERT INTO thread_activity (
+    thread_id, user_id, message_count,
+    last_message_id, last_message_at, last_message_preview, last_activity_at
+)
+SELECT t.id, t.user_id,
+       (SELECT count(*) FROM messages WHERE thread_id = t.id),
+       last.id, last.created_at, substr(last.content, 1, 200),
+       coalesce(last.created_at, t.created_at, CURRENT_TIMESTAMP)
+FROM threads t
+LEFT JOIN messages last ON last.id = (SELECT max(id) FROM messages WHERE thread_id = t.id)
+WHERE t.id > :after AND t.id <= :upto
+"""
+
+USER_STATS_SQL = """
+INSERT OR REPLACE INTO user_stats (user_id, thread_count)
+SELECT user_id, count(*) FROM threads GROUP BY user_id
+"""
+
+async def backfill(engine: AsyncEngine) -> int:
+    """Summarize threads newer than the highest summarized one, in committed batches."""
+    summarized = 0
+    async with engine.connect() as conn:
+        after = (await conn.execute(text("SELECT coalesce(max(thread_id), 0) FROM thread_activity"))).scalar()
+        last = (await conn.execute(text("SELECT coalesce(max(id), 0) FROM threads"))).scalar()
+        while after < last:
+            upto = after + BACKFILL_BATCH
+            result = await conn.execute(text(BACKFILL_SQL), {"after": after, "upto": upto})
+            await conn.commit()
+            summarized += result.rowcount
+            after = upto
+        if summarized:
+            await conn.execute(text(USER_STATS_SQL))
+            await conn.commit()
+    return summarized
+
+async def rebuild(engine: AsyncEngine) -> int:
+    """Recompute every summary from threads and messages."""
+    async with engine.connect() as conn:
+        await conn.execute(text("DELETE FROM thread_activity"))
+        await conn.execute(text("DELETE FROM user_stats"))
+        await conn.commit()
+    return await backfill(engine)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the thread and user summary tables")
+    parser.add_argument("command", choices=["backfill", "rebuild"])
+    args = parser.parse_args()
+
+    from .session import async_engine, init_db_async
+
+    async def run():
+        await init_db_async()
+        summarized = await (rebuild if args.command == "rebuild" else backfill)(async_engine)
+        print(f"Summarized {summarized} threads")
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+from .models import Message
+from .session import async_engine
+from ..core.config import settings
+
+logger = logging.getLogger("writer")
+
+# Statement run before each batch for a MESSAGE_WRITE_DURABILITY mode; "" keeps the connection's setting
+DURABILITY_SQL = {
+    "sqlite": {"full": "PRAGMA synchronous=FULL", "relaxed": "PRAGMA synchronous=NORMAL"},
+    "postgresql": {"full": "SET LOCAL synchronous_commit = on", "relaxed": "SET LOCAL synchronous_commit = off"},
+}
+DURABILITY_MODES = ("", "full", "relaxed")
+
+class MessageWriter:
+    """Group-commit persistence for chat messages.
+
+    Inserts from every connection are collected for up to `window_ms` (or
+    until `max_batch` rows are waiting) and written as a single multi-row
+    INSERT ... RETURNING plus one commit. Each caller gets its row id back
+    once the commit is done: callers broadcast the id and may read the row
+    back through the reader pool, which only sees committed rows.
+
+    `durability` decides what "done" means. "full" waits until the batch is
+    on disk; "relaxed" returns once the commit is visible to readers and
+    leaves the flush to the WAL, so a power cut (not a process crash) can
+    lose the last acknowledged batches. Only the batch's own transaction is
+    affected; on SQLite the connection gets SQLITE_SYNCHRONOUS back afterwards.
+    """
+
+    def __init__(self, engine: AsyncEngine, window_ms: float, max_batch: int, durability: str = ""):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.engine = engine
+        self.durability = durability
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.rows = 0
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._full.set()
+            await self._task
+            self._task = None
+
+    async def save(self, thread_id: int, content: str, is_bot: bool) -> int:
+        if self._task is None or self._stopping:
+            raise RuntimeError("MessageWriter is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(({"thread_id": thread_id, "content": content, "is_bot": is_bot}, future))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await asyncio.shield(future)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "pending": len(self._pending),
+            "avg_batch": round(self.rows / self.batches, 2) if self.batches else 0,
+        }
+
+    async def _run(self):
+        while not (self._stopping and not self._pending):
+            await self._wakeup.wait()
+            if not self._stopping and len(self._pending) < self.max_batch and self.window:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if len(self._pending) < self.max_batch and not self._stopping:
+                self._full.clear()
+            if not self._pending and not self._stopping:
+                self._wakeup.clear()
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            async with self.engine.connect() as conn:
+                durability, reset = self._durability_sql(conn.dialect.name)
+                if durability:
+                    await conn.exec_driver_sql(durability)
+                try:
+                    result = await conn.execute(
+                        insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                        rows
+                    )
+                    ids = result.scalars().all()
+                    await conn.commit()
+                finally:
+                    if reset:
+                        await conn.rollback()
+                        await conn.exec_driver_sql(reset)
+            self._resolve(futures, ids)
+            self.batches += 1
+            self.rows += len(rows)
+        except Exception as e:
+            logger.error(f"Failed to write batch of {len(rows)} messages: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _durability_sql(self, dialect: str) -> Tuple[Optional[str], Optional[str]]:
+        """The statement that sets this batch's durability, and the one that undoes it afterwards."""
+        statement = DURABILITY_SQL.get(dialect, {}).get(self.durability)
+        if statement is None or dialect != "sqlite":
+            # SET LOCAL ends with the transaction
+            return statement, None
+        reset = f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}"
+        if statement.upper() == reset.upper():
+            return None, None
+        return statement, reset
+
+    @staticmethod
+    def _resolve(futures: List[asyncio.Future], ids: List[int]):
+        for future, message_id in zip(futures, ids):
+            if not future.done():
+                future.set_result(message_id)
+
+
+message_writer = MessageWriter(
+    async_engine,
+    window_ms=settings.MESSAGE_WRITE_WINDOW_MS,
+    max_batch=settings.MESSAGE_WRITE_MAX_BATCH,
+    durability=settings.MESSAGE_WRITE_DURABILITY
+)
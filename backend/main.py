@@ -1,14 +1,29 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 import uvicorn
 from app.api import router
-from app.db.session import init_db_async
+from app.db.session import init_db_async, async_engine, is_sqlite
+from app.db import fts, summaries
+from app.core.websocket import manager
+from app.core.tickets import sweep_legacy_tokens
+from app.core.google_auth import google_verifier
+from app.db.writer import message_writer
+from app.db.deletion import account_deleter
+from app.core.metrics import MetricsMiddleware
+from app.core.config import settings
+from app.core.logs import setup_logging
 from contextlib import asynccontextmanager
+import logging
 from fastapi.middleware.cors import CORSMiddleware
 
+setup_logging()
+logger = logging.getLogger("main")
+
 app = FastAPI(
     title="Chatbot API",
     description="API for Chatbot",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse
 )
 origins = [
     "http://localhost:3000",
@@ -21,15 +36,36 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 app.include_router(router)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db_async()
+    if is_sqlite():
+        # Index and summarize anything written before the triggers existed
+        indexed = await fts.backfill(async_engine)
+        if indexed:
+            logger.info(f"Indexed {indexed} messages for search")
+        summarized = await summaries.backfill(async_engine)
+        if summarized:
+            logger.info(f"Summarized {summarized} threads")
+    await sweep_legacy_tokens()
+    message_writer.start()
+    await manager.start()
+    await google_verifier.start()
+    # Revokes deleted users before the first request and resumes unfinished deletions
+    await account_deleter.start()
     yield
-    # Add any cleanup code here if necessary
+    await account_deleter.stop()
+    await google_verifier.stop()
+    await manager.stop()
+    await message_writer.stop()
 
 app.router.lifespan_context = lifespan
 
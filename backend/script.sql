@@ -30,6 +30,96 @@ CREATE TABLE IF NOT EXISTS messages (
     FOREIGN KEY (thread_id) REFERENCES threads(id) ON DELETE CASCADE
 );
 
+-- Create Thread Contexts Table (rolling summary of turns outside the prompt window)
+CREATE TABLE IF NOT EXISTS thread_contexts (
+    thread_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL DEFAULT '',
+    summarized_upto_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (thread_id) REFERENCES threads(id) ON DELETE CASCADE
+);
+
+-- Create Thread Activity Table (per-thread counters and last message, kept by triggers)
+CREATE TABLE IF NOT EXISTS thread_activity (
+    thread_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_message_id INTEGER,
+    last_message_at TIMESTAMP,
+    last_message_preview VARCHAR(200),
+    -- last_message_at, or the thread's created_at while it has no messages
+    last_activity_at TIMESTAMP NOT NULL,
+    FOREIGN KEY (thread_id) REFERENCES threads(id) ON DELETE CASCADE
+);
+
+-- Create User Stats Table (per-user counters, kept by triggers)
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY,
+    thread_count INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TRIGGER IF NOT EXISTS threads_activity_insert AFTER INSERT ON threads BEGIN
+    INSERT INTO thread_activity (thread_id, user_id, last_activity_at)
+    VALUES (new.id, new.user_id, coalesce(new.created_at, CURRENT_TIMESTAMP));
+    INSERT INTO user_stats (user_id, thread_count) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET thread_count = thread_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS threads_activity_delete AFTER DELETE ON threads BEGIN
+    DELETE FROM thread_activity WHERE thread_id = old.id;
+    UPDATE user_stats SET thread_count = thread_count - 1 WHERE user_id = old.user_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_activity_insert AFTER INSERT ON messages BEGIN
+    UPDATE thread_activity SET
+        message_count = message_count + 1,
+        last_message_id = new.id,
+        last_message_at = new.created_at,
+        last_message_preview = substr(new.content, 1, 200),
+        last_activity_at = coalesce(new.created_at, CURRENT_TIMESTAMP)
+    WHERE thread_id = new.thread_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_activity_delete AFTER DELETE ON messages BEGIN
+    UPDATE thread_activity SET message_count = message_count - 1 WHERE thread_id = old.thread_id;
+    -- Only deleting the newest message changes the rest: step back to the one before it
+    UPDATE thread_activity SET last_message_id = (SELECT max(id) FROM messages WHERE thread_id = old.thread_id)
+    WHERE thread_id = old.thread_id AND last_message_id = old.id;
+    UPDATE thread_activity SET
+        last_message_at = (SELECT created_at FROM messages WHERE id = thread_activity.last_message_id),
+        last_message_preview = (SELECT substr(content, 1, 200) FROM messages WHERE id = thread_activity.last_message_id),
+        last_activity_at = coalesce(
+            (SELECT created_at FROM messages WHERE id = thread_activity.last_message_id),
+            (SELECT created_at FROM threads WHERE id = old.thread_id),
+            last_activity_at
+        )
+    WHERE thread_id = old.thread_id AND (last_message_id IS NULL OR last_message_id < old.id);
+END;
+
+-- Create Message Search Index (FTS5)
+-- owner holds 'u<user_id>' so a user's search is a MATCH on the same index
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    owner,
+    thread_id UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, owner, thread_id)
+    SELECT new.id, new.content, 'u' || threads.user_id, new.thread_id
+    FROM threads WHERE threads.id = new.thread_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+    UPDATE messages_fts SET content = new.content WHERE rowid = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    DELETE FROM messages_fts WHERE rowid = old.id;
+END;
+
 -- Create Web Socket Token Table
 CREATE TABLE IF NOT EXISTS web_socket_tokens (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,9 +129,25 @@ CREATE TABLE IF NOT EXISTS web_socket_tokens (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+-- Create Account Deletions Table (progress of background account deletions)
+-- No foreign key: the row outlives the user, so their tokens stay refused
+CREATE TABLE IF NOT EXISTS account_deletions (
+    user_id INTEGER PRIMARY KEY,
+    requested_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    threads_deleted INTEGER NOT NULL DEFAULT 0,
+    messages_deleted INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP,
+    completed_at TIMESTAMP
+);
+
 -- Create Indexes
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_provider ON users(auth_provider, provider_user_id);
-CREATE INDEX IF NOT EXISTS idx_threads_user ON threads(user_id);
-CREATE INDEX IF NOT EXISTS idx_messages_thread ON messages(thread_id);
+-- Composite keys used by keyset pagination
+DROP INDEX IF EXISTS idx_threads_user;
+DROP INDEX IF EXISTS idx_messages_thread;
+CREATE INDEX IF NOT EXISTS idx_threads_user_created ON threads(user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_messages_thread_id ON messages(thread_id, id);
+-- Sidebar order: a user's threads by latest activity
+CREATE INDEX IF NOT EXISTS idx_thread_activity_user ON thread_activity(user_id, last_activity_at, thread_id);
 CREATE INDEX IF NOT EXISTS idx_web_socket_tokens_token ON web_socket_tokens(token);
\ No newline at end of file
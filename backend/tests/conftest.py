@@ -0,0 +1,29 @@
+import os
+import tempfile
+import pytest
+
+# Settings are read when app modules are imported; give the required ones test values
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test-client-id")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test")
+os.environ.setdefault("APPLE_CLIENT_ID", "test")
+os.environ.setdefault("APPLE_CLIENT_SECRET", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='chatbot-tests-')}/chatbot.db")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database(monkeypatch):
+    """The test database with the schema applied; engines are disposed afterwards since each test has its own loop."""
+    from app.db.session import async_engine, async_read_engine, init_db_async
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    await init_db_async()
+    yield
+    await async_engine.dispose()
+    await async_read_engine.dispose()
@@ -0,0 +1,173 @@
+import asyncio
+import orjson
+import pytest
+from app.core.backplane import RedisBackplane, _read_reply
+
+
+class RespStub:
+    """Just enough of Redis for the backplane: SUBSCRIBE, PUBLISH, and dropping every connection."""
+
+    def __init__(self):
+        self.published = []
+        self.subscribers = {}
+        self.writers = set()
+        self.server = None
+        self.port = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        self.drop_connections()
+        await self.server.wait_closed()
+
+    def drop_connections(self):
+        for writer in list(self.writers):
+            writer.close()
+        self.writers.clear()
+        self.subscribers.clear()
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}/0"
+
+    async def _handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                command = await _read_reply(reader)
+                name = command[0].upper()
+                if name == b"SUBSCRIBE":
+                    self.subscribers.setdefault(command[1], set()).add(writer)
+                    writer.write(b"*3\r\n" + _bulk(b"subscribe") + _bulk(command[1]) + b":1\r\n")
+                elif name == b"PUBLISH":
+                    self.published.append(orjson.loads(command[2]))
+                    receivers = self.subscribers.get(command[1], set())
+                    for subscriber in receivers:
+                        subscriber.write(b"*3\r\n" + _bulk(b"message") + _bulk(command[1]) + _bulk(command[2]))
+                    writer.write(b":%d\r\n" % len(receivers))
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            for subscribers in self.subscribers.values():
+                subscribers.discard(writer)
+            writer.close()
+
+
+def _bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def eventually(predicate, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+class Receiver:
+    def __init__(self):
+        self.frames = []
+
+    async def __call__(self, user_id, messages):
+        self.frames.extend((user_id, message["i"]) for message in messages)
+
+
+@pytest.fixture
+async def stub():
+    stub = RespStub()
+    await stub.start()
+    yield stub
+    await stub.stop()
+
+
+async def started(url: str, **kwargs):
+    backplane = RedisBackplane(url, "chat", **kwargs)
+    receiver = Receiver()
+    await backplane.start(receiver)
+    return backplane, receiver
+
+
+@pytest.mark.anyio
+async def test_publishes_are_batched_by_user(stub):
+    backplane, receiver = await started(stub.url, batch_interval=0.05)
+    try:
+        for i in range(10):
+            await backplane.publish(1 + i % 2, {"i": i})
+        # Local sockets get every frame straight away
+        assert receiver.frames == [(1 + i % 2, i) for i in range(10)]
+        await eventually(lambda: backplane.published == 10)
+        assert len(stub.published) == 1
+        batches = dict(stub.published[0]["batches"])
+        assert [m["i"] for m in batches[1]] == [0, 2, 4, 6, 8]
+        assert [m["i"] for m in batches[2]] == [1, 3, 5, 7, 9]
+    finally:
+        await backplane.stop()
+
+
+@pytest.mark.anyio
+async def test_other_workers_receive_and_own_batches_are_skipped(stub):
+    first, first_frames = await started(stub.url, batch_interval=0)
+    second, second_frames = await started(stub.url, batch_interval=0)
+    try:
+        await eventually(lambda: len(stub.subscribers.get(b"chat", ())) == 2)
+        await first.publish(7, {"i": 1})
+        await eventually(lambda: second_frames.frames == [(7, 1)])
+        await second.publish(7, {"i": 2})
+        await eventually(lambda: first_frames.frames == [(7, 1), (7, 2)])
+        await asyncio.sleep(0.1)
+        # Each worker saw its own frame once, from the local delivery, not again from Redis
+        assert first_frames.frames == [(7, 1), (7, 2)]
+        assert second_frames.frames == [(7, 1), (7, 2)]
+    finally:
+        await first.stop()
+        await second.stop()
+
+
+@pytest.mark.anyio
+async def test_reconnects_and_requeues_after_connection_drop(stub):
+    publisher, _ = await started(stub.url, batch_interval=0)
+    listener, received = await started(stub.url, batch_interval=0)
+    try:
+        await eventually(lambda: len(stub.subscribers.get(b"chat", ())) == 2)
+        await publisher.publish(1, {"i": 0})
+        await eventually(lambda: received.frames == [(1, 0)])
+
+        stub.drop_connections()
+        for i in range(1, 4):
+            await publisher.publish(1, {"i": i})
+        # The PUBLISH on the dropped connection fails; its frames are retried on a new one
+        await eventually(lambda: publisher.published == 4)
+        assert publisher.retries >= 1
+        assert publisher.dropped == 0
+        assert [i for batch in stub.published for _, messages in batch["batches"] for i in (m["i"] for m in messages)] == [0, 1, 2, 3]
+        # The listener resubscribes after its backoff; pub/sub does not replay what it missed meanwhile
+        await eventually(lambda: len(stub.subscribers.get(b"chat", ())) == 2)
+        await publisher.publish(1, {"i": 4})
+        await eventually(lambda: received.frames[-1:] == [(1, 4)])
+    finally:
+        await publisher.stop()
+        await listener.stop()
+
+
+@pytest.mark.anyio
+async def test_frames_over_max_pending_are_dropped_while_down(stub):
+    backplane, _ = await started(stub.url, batch_interval=0, max_pending=5)
+    try:
+        await stub.stop()
+        for i in range(8):
+            await backplane.publish(1, {"i": i})
+        await eventually(lambda: backplane.dropped == 3)
+        await stub.start()
+        await eventually(lambda: backplane.published == 5)
+        # The oldest frames went; the newest five are published in order
+        assert [m["i"] for batch in stub.published for _, messages in batch["batches"] for m in messages] == [3, 4, 5, 6, 7]
+        assert backplane.stats()["pending"] == 0
+    finally:
+        await backplane.stop()
@@ -0,0 +1,63 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from sqlalchemy import select, text
+from app.api import chat
+from app.core.admission import admission
+from app.core.context import context_builder
+from app.db.models import Message
+from app.db.session import async_engine, async_read_engine
+from app.db.writer import message_writer
+
+
+@pytest.fixture
+async def thread(database):
+    async with async_engine.connect() as conn:
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (name, email, auth_provider, provider_user_id) "
+            "VALUES ('Chat', :email, 'GOOGLE', :sub) RETURNING id"
+        ), {"email": f"{uuid4().hex}@example.com", "sub": uuid4().hex})).scalar_one()
+        thread_id = (await conn.execute(text(
+            "INSERT INTO threads (user_id, title) VALUES (:user_id, 'Chat') RETURNING id"
+        ), {"user_id": user_id})).scalar_one()
+        await conn.commit()
+    message_writer.start()
+    yield user_id, thread_id
+    await message_writer.stop()
+
+
+@pytest.fixture
+def frames(monkeypatch):
+    sent = []
+
+    async def broadcast_to_user(frame, user_id):
+        sent.append(frame)
+
+    monkeypatch.setattr(chat.manager, "broadcast_to_user", broadcast_to_user)
+    monkeypatch.setattr(chat.manager, "send", lambda websocket, user_id, frame: sent.append(frame))
+    return sent
+
+
+@pytest.mark.anyio
+async def test_turn_rejected_after_check_is_retracted(monkeypatch, thread, frames):
+    user_id, thread_id = thread
+    # One token: both turns pass check(), only the first one to acquire gets it
+    monkeypatch.setattr(admission, "rate", 0.001)
+    monkeypatch.setattr(admission, "burst", 1)
+    await context_builder.build(thread_id)
+
+    await asyncio.gather(*(
+        chat.process_message(None, user_id, {"type": "message", "thread_id": thread_id, "content": f"turn {i}", "cache": False})
+        for i in range(2)
+    ))
+
+    errors = [frame for frame in frames if frame["type"] == "error"]
+    assert len(errors) == 1 and errors[0]["retracted"]
+    assert len([frame for frame in frames if frame["type"] == "message_complete"]) == 1
+    async with async_read_engine.connect() as conn:
+        rows = (await conn.execute(select(Message.id, Message.is_bot).filter(Message.thread_id == thread_id))).all()
+    # The answered turn and its reply remain; the rejected turn is gone from the table and the context
+    assert errors[0]["reply_to"] not in [row.id for row in rows]
+    assert sorted(row.is_bot for row in rows) == [False, True]
+    contents = await context_builder.build(thread_id)
+    assert len(contents) == 2
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import rsa
+from jose import jwk, jwt
+from app.core.google_auth import GoogleTokenVerifier
+
+CLIENT_ID = "test-client-id"
+
+
+class JWKSStub:
+    """Serves a JWKS document on localhost; tests change `keys` and `status` as they go."""
+
+    def __init__(self):
+        self.keys = []
+        self.status = 200
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                body = json.dumps({"keys": stub.keys}).encode()
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", "public, max-age=3600")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/oauth2/v3/certs"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SigningKey:
+    def __init__(self, kid: str):
+        self.kid = kid
+        public, private = rsa.newkeys(1024)
+        self.pem = private.save_pkcs1().decode()
+        self.jwk = dict(jwk.construct(public.save_pkcs1().decode(), "RS256").to_dict(), kid=kid, use="sig")
+
+    def token(self, kid: str = None, **claims) -> str:
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": CLIENT_ID,
+            "sub": "1234",
+            "email": "user@example.com",
+            "iat": int(time.time()),
+            "exp": int(time.time()) + 600,
+            **claims,
+        }
+        return jwt.encode(claims, self.pem, algorithm="RS256", headers={"kid": kid or self.kid})
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return SigningKey("key-1"), SigningKey("key-2")
+
+
+@pytest.fixture
+def stub(keys):
+    stub = JWKSStub()
+    stub.keys = [keys[0].jwk]
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def verifier(stub):
+    return GoogleTokenVerifier(CLIENT_ID, stub.url, min_refresh_interval=0)
+
+
+@pytest.mark.anyio
+async def test_valid_token(stub, verifier, keys):
+    claims = await verifier.verify(keys[0].token())
+    assert claims["sub"] == "1234"
+    assert claims["email"] == "user@example.com"
+    # Keys are cached: the second token does not hit the server again
+    await verifier.verify(keys[0].token(sub="5678"))
+    assert stub.hits == 1
+    assert verifier.stats()["verified"] == 2
+
+
+@pytest.mark.anyio
+async def test_unknown_kid_refetches(stub, verifier, keys):
+    await verifier.verify(keys[0].token())
+    # Google rotates in a new key
+    stub.keys = [keys[0].jwk, keys[1].jwk]
+    claims = await verifier.verify(keys[1].token())
+    assert claims["sub"] == "1234"
+    assert stub.hits == 2
+    assert verifier.refreshes == 2
+
+
+@pytest.mark.anyio
+async def test_unknown_kid_refetch_is_rate_limited(stub, keys):
+    verifier = GoogleTokenVerifier(CLIENT_ID, stub.url, min_refresh_interval=30)
+    await verifier.verify(keys[0].token())
+    for _ in range(3):
+        with pytest.raises(ValueError, match="unknown key"):
+            await verifier.verify(keys[1].token())
+    assert stub.hits == 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("claims, error", [
+    ({"exp": int(time.time()) - 60}, "expired"),
+    ({"aud": "someone-else"}, "audience"),
+    ({"iss": "https://evil.example.com"}, "issuer"),
+])
+async def test_rejected_claims(verifier, keys, claims, error):
+    with pytest.raises(ValueError, match=error):
+        await verifier.verify(keys[0].token(**claims))
+    assert verifier.failed == 1
+
+
+@pytest.mark.anyio
+async def test_bad_signature(verifier, keys):
+    # Signed with key-2 but claims to be key-1
+    with pytest.raises(ValueError, match="Invalid token"):
+        await verifier.verify(keys[1].token(kid="key-1"))
+
+
+@pytest.mark.anyio
+async def test_malformed_token(verifier):
+    with pytest.raises(ValueError, match="Malformed"):
+        await verifier.verify("not-a-jwt")
+
+
+@pytest.mark.anyio
+async def test_jwks_fetch_failure(stub, verifier, keys):
+    stub.status = 500
+    with pytest.raises(requests.HTTPError):
+        await verifier.verify(keys[0].token())
+    assert verifier.refresh_failures == 1
+    # The next token after Google recovers fetches again
+    stub.status = 200
+    claims = await verifier.verify(keys[0].token())
+    assert claims["sub"] == "1234"
+    assert verifier.refreshes == 1
+
+
+@pytest.mark.anyio
+async def test_failed_refresh_keeps_cached_keys(stub, verifier, keys):
+    await verifier.refresh()
+    stub.status = 503
+    with pytest.raises(requests.HTTPError):
+        await verifier.refresh()
+    assert (await verifier.verify(keys[0].token()))["sub"] == "1234"
+
+
+@pytest.mark.anyio
+async def test_verify_runs_in_thread_pool(verifier, keys):
+    await verifier.refresh()
+    threads = []
+    decode = verifier._decode
+
+    def slow_decode(token, key):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return decode(token, key)
+
+    verifier._decode = slow_decode
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    task = asyncio.create_task(ticker())
+    try:
+        await asyncio.gather(*(verifier.verify(keys[0].token()) for _ in range(4)))
+    finally:
+        task.cancel()
+    assert all(name.startswith("google-auth") for name in threads) and len(threads) == 4
+    # Four 200ms decodes ran while the loop kept ticking every ~10ms
+    assert len(ticks) > 10
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.1
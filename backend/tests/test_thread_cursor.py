@@ -0,0 +1,43 @@
+from uuid import uuid4
+import pytest
+from sqlalchemy import text
+from app.api.chat import _decode_cursor, list_threads
+from app.db.session import AsyncReadSessionLocal, async_engine
+
+
+async def pages(user_id: int, limit: int):
+    seen, cursor = [], None
+    while True:
+        async with AsyncReadSessionLocal() as db:
+            threads, cursor = await list_threads(db, user_id, limit, _decode_cursor(cursor) if cursor else None)
+        seen.extend(thread["id"] for thread in threads)
+        # A cursor that compares wrongly can hand back the same page forever
+        if not cursor or len(seen) > 100:
+            return seen
+
+
+@pytest.mark.anyio
+async def test_pages_cover_each_thread_once_across_timestamp_formats(database):
+    async with async_engine.connect() as conn:
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (name, email, auth_provider, provider_user_id) "
+            "VALUES ('Cursor', :email, 'GOOGLE', :sub) RETURNING id"
+        ), {"email": f"{uuid4().hex}@example.com", "sub": uuid4().hex})).scalar_one()
+        # Seconds only, as a CURRENT_TIMESTAMP default writes them, next to microsecond ones
+        created = ["2026-01-01 12:00:00"] * 3 + ["2026-01-01 12:00:00.500000", "2026-01-01 12:00:01"] + ["2026-01-01 11:59:59"] * 2
+        ids = []
+        for created_at in created:
+            ids.append((await conn.execute(text(
+                "INSERT INTO threads (user_id, title, created_at) VALUES (:user_id, 'Cursor', :created_at) RETURNING id"
+            ), {"user_id": user_id, "created_at": created_at})).scalar_one())
+        await conn.commit()
+
+    newest_first = [id for _, id in sorted(zip(created, ids), reverse=True)]
+    for limit in (1, 2, 3):
+        assert await pages(user_id, limit) == newest_first
+
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(Exception) as error:
+        _decode_cursor("bm90LWEtY3Vyc29y")
+    assert error.value.status_code == 400
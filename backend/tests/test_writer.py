@@ -0,0 +1,101 @@
+import asyncio
+from uuid import uuid4
+import pytest
+from sqlalchemy import event, select, text
+from app.db.models import Message
+from app.db.session import async_engine, async_read_engine
+from app.db.writer import MessageWriter
+
+
+@pytest.fixture
+async def thread_id(database):
+    async with async_engine.connect() as conn:
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (name, email, auth_provider, provider_user_id) "
+            "VALUES ('Writer', :email, 'GOOGLE', :sub) RETURNING id"
+        ), {"email": f"{uuid4().hex}@example.com", "sub": uuid4().hex})).scalar_one()
+        thread_id = (await conn.execute(text(
+            "INSERT INTO threads (user_id, title) VALUES (:user_id, 'Writer') RETURNING id"
+        ), {"user_id": user_id})).scalar_one()
+        await conn.commit()
+    return thread_id
+
+
+@pytest.fixture
+def statements():
+    """SQL run on the writer connection during the test."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+async def running(**kwargs) -> MessageWriter:
+    writer = MessageWriter(async_engine, window_ms=20, max_batch=kwargs.pop("max_batch", 100), **kwargs)
+    writer.start()
+    return writer
+
+
+@pytest.mark.anyio
+async def test_concurrent_saves_share_a_commit_and_are_readable(thread_id):
+    writer = await running()
+    try:
+        ids = await asyncio.gather(*(writer.save(thread_id, f"message {i}", is_bot=False) for i in range(20)))
+    finally:
+        await writer.stop()
+    assert ids == sorted(ids)
+    assert writer.stats()["batches"] == 1
+    # Once save returns, the reader pool sees the row
+    async with async_read_engine.connect() as conn:
+        rows = (await conn.execute(select(Message.id, Message.content).filter(Message.id.in_(ids)).order_by(Message.id))).all()
+    assert [row.content for row in rows] == [f"message {i}" for i in range(20)]
+
+
+@pytest.mark.anyio
+async def test_full_durability_applies_to_the_batch_only(thread_id, statements):
+    writer = await running(durability="full")
+    try:
+        await writer.save(thread_id, "durable", is_bot=False)
+    finally:
+        await writer.stop()
+    flush = [s for s in statements if s.startswith("PRAGMA synchronous") or s.startswith("INSERT INTO messages")]
+    assert flush == ["PRAGMA synchronous=FULL", flush[1], "PRAGMA synchronous=NORMAL"]
+    assert flush[1].startswith("INSERT INTO messages")
+    async with async_engine.connect() as conn:
+        assert (await conn.exec_driver_sql("PRAGMA synchronous")).scalar() == 1
+
+
+@pytest.mark.anyio
+async def test_relaxed_durability_matching_the_connection_runs_nothing_extra(thread_id, statements):
+    writer = await running(durability="relaxed")
+    try:
+        await writer.save(thread_id, "relaxed", is_bot=False)
+    finally:
+        await writer.stop()
+    assert not [s for s in statements if s.startswith("PRAGMA synchronous")]
+
+
+@pytest.mark.anyio
+async def test_failed_batch_fails_every_caller_and_resets_durability(thread_id, statements):
+    writer = await running(durability="full")
+    try:
+        results = await asyncio.gather(
+            writer.save(thread_id, "fine", is_bot=False),
+            writer.save(thread_id, None, is_bot=False),
+            return_exceptions=True
+        )
+    finally:
+        await writer.stop()
+    assert all(isinstance(result, Exception) for result in results)
+    assert statements[-1] == "PRAGMA synchronous=NORMAL"
+    async with async_read_engine.connect() as conn:
+        assert (await conn.execute(select(Message.id).filter(Message.content == "fine"))).first() is None
+
+
+def test_unknown_durability_mode():
+    with pytest.raises(ValueError):
+        MessageWriter(async_engine, window_ms=5, max_batch=10, durability="insert")
@@ -53,17 +53,22 @@ export default function ChatThread({ threadId }: ChatThreadProps) {
     console.log(wsMessages);
     if (wsMessages.length > 0 && initialFetchComplete) {
       setMessages(prev => {
-        const newMessages = [...prev]
+        const wsIds = new Set(wsMessages.map(m => m.message_id))
+        // Streaming placeholders have negative ids; drop them once the saved reply replaces them
+        const newMessages = prev.filter(m => m.id > 0 || wsIds.has(m.id))
         for (const wsMsg of wsMessages) {
+          const message = {
+            id: wsMsg.message_id,
+            content: wsMsg.content,
+            is_bot: wsMsg.is_bot,
+            timestamp: wsMsg.timestamp
+          }
           // Check if message already exists
           const existingIndex = newMessages.findIndex(m => m.id === wsMsg.message_id)
           if (existingIndex === -1) {
-            newMessages.push({
-              id: wsMsg.message_id,
-              content: wsMsg.content,
-              is_bot: wsMsg.is_bot,
-              timestamp: wsMsg.timestamp
-            })
+            newMessages.push(message)
+          } else {
+            newMessages[existingIndex] = message
           }
         }
         return newMessages
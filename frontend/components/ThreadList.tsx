@@ -111,7 +111,14 @@ export default function ThreadList({
                 }`}
                 onClick={() => onSelectThread(thread)}
               >
-                {thread.title}
+                <div className="flex flex-col min-w-0">
+                  <span className="truncate">{thread.title}</span>
+                  {thread.last_message_preview && (
+                    <span className="truncate text-xs text-gray-400">
+                      {thread.last_message_preview}
+                    </span>
+                  )}
+                </div>
               </Button>
             ))}
           </ScrollArea>
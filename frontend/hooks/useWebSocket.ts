@@ -9,6 +9,11 @@ interface Message {
   content: string;
   is_bot: boolean;
   timestamp: string;
+  reply_to?: number;
+  retracted?: boolean;
+  delta?: string;
+  seq?: number;
+  epoch?: string;
 }
 
 interface UseWebSocketReturn {
@@ -24,6 +29,12 @@ export function useWebSocket(): UseWebSocketReturn {
   const [messages, setMessages] = useState<Record<number, Message[]>>({});
   const ws = useRef<WebSocket | null>(null);
   const reconnectTimeout = useRef<NodeJS.Timeout | null>(null);
+  // Where this client is in the server's frame sequence, sent back on reconnect to get only the gap
+  const session = useRef<{ epoch: string | null; lastSeq: number; lastMessageId: number }>({
+    epoch: null,
+    lastSeq: 0,
+    lastMessageId: 0,
+  });
 
   const connect = useCallback(async () => {
     if (ws.current && (ws.current.readyState === WebSocket.OPEN || ws.current.readyState === WebSocket.CONNECTING)) {
@@ -40,7 +51,11 @@ export function useWebSocket(): UseWebSocketReturn {
       }
 
       // Construct the WebSocket URL using the token
-      const wsUrl = `${process.env.NEXT_PUBLIC_WS_URL}/chat/ws/${ws_token}`;
+      let wsUrl = `${process.env.NEXT_PUBLIC_WS_URL}/chat/ws/${ws_token}`;
+      if (session.current.epoch) {
+        const { epoch, lastSeq, lastMessageId } = session.current;
+        wsUrl += `?epoch=${epoch}&last_seq=${lastSeq}&last_message_id=${lastMessageId}`;
+      }
 
       const socket = new WebSocket(wsUrl);
 
@@ -60,7 +75,27 @@ export function useWebSocket(): UseWebSocketReturn {
           return;
         }
 
+        if (data.type === 'session') {
+          session.current.epoch = data.epoch as string;
+          session.current.lastSeq = data.seq as number;
+          return;
+        }
+
+        if (data.seq !== undefined) {
+          session.current.lastSeq = Math.max(session.current.lastSeq, data.seq);
+        }
+        if ((data.type === 'message' || data.type === 'message_complete') && data.message_id > 0) {
+          session.current.lastMessageId = Math.max(session.current.lastMessageId, data.message_id);
+        }
+
         if (data.type === 'error') {
+          if (data.retracted) {
+            // The server deleted the message this error answers
+            setMessages((prev) => ({
+              ...prev,
+              [data.thread_id]: (prev[data.thread_id] || []).filter((m) => m.message_id !== data.reply_to),
+            }));
+          }
           toast({
             title: 'Error',
             description: data.content || 'An error occurred.',
@@ -69,11 +104,62 @@ export function useWebSocket(): UseWebSocketReturn {
           return;
         }
 
-        if (data.type === 'message') {
+        if (data.type === 'message_delta') {
+          // Streamed chunks accumulate in a placeholder keyed by the user message they answer
+          const pendingId = -(data.reply_to as number);
+          setMessages((prev) => {
+            const threadMessages = prev[data.thread_id] || [];
+            const existing = threadMessages.find((m) => m.message_id === pendingId);
+            return {
+              ...prev,
+              [data.thread_id]: existing
+                ? threadMessages.map((m) =>
+                    m.message_id === pendingId ? { ...m, content: m.content + data.delta } : m
+                  )
+                : [
+                    ...threadMessages,
+                    {
+                      type: 'message',
+                      thread_id: data.thread_id,
+                      message_id: pendingId,
+                      content: data.delta || '',
+                      is_bot: true,
+                      timestamp: new Date().toISOString(),
+                    },
+                  ],
+            };
+          });
+          return;
+        }
+
+        if (data.type === 'message_complete') {
+          const pendingId = -(data.reply_to as number);
           setMessages((prev) => ({
             ...prev,
-            [data.thread_id]: [...(prev[data.thread_id] || []), data],
+            [data.thread_id]: [
+              ...(prev[data.thread_id] || []).filter((m) => m.message_id !== pendingId),
+              { ...data, type: 'message' },
+            ],
           }));
+          return;
+        }
+
+        if (data.type === 'message_cancelled') {
+          const pendingId = -(data.reply_to as number);
+          setMessages((prev) => ({
+            ...prev,
+            [data.thread_id]: (prev[data.thread_id] || []).filter((m) => m.message_id !== pendingId),
+          }));
+          return;
+        }
+
+        if (data.type === 'message') {
+          setMessages((prev) => {
+            const threadMessages = prev[data.thread_id] || [];
+            // A resumed session can deliver a message that already arrived live
+            if (threadMessages.some((m) => m.message_id === data.message_id)) return prev;
+            return { ...prev, [data.thread_id]: [...threadMessages, data] };
+          });
         }
       };
 
@@ -36,8 +36,40 @@ async function fetchWithRefresh(input: RequestInfo, init?: RequestInit): Promise
   return res
 }
 
+interface Bootstrap {
+  user: User
+  threads: ThreadResponse[]
+  threads_next_cursor: string | null
+  thread_id: number | null
+  messages: unknown[]
+  messages_next_cursor: string | null
+  ws_token: string
+}
+
+// The first load asks GET /bootstrap once; each part of it is handed out a
+// single time (the ws_token is single-use), after that the regular endpoints apply
+let bootstrapPromise: Promise<Bootstrap | null> | null = null
+const bootstrapUsed = new Set<string>()
+
+async function takeBootstrap(part: string): Promise<Bootstrap | null> {
+  if (bootstrapUsed.has(part)) return null
+  bootstrapUsed.add(part)
+  return api.bootstrap()
+}
+
 export const api = {
+  bootstrap(): Promise<Bootstrap | null> {
+    if (!bootstrapPromise) {
+      bootstrapPromise = fetchWithRefresh(`${API_URL}/bootstrap`)
+        .then((res) => (res.ok ? res.json() : null))
+        .catch(() => null)
+    }
+    return bootstrapPromise
+  },
+
   async getCurrentUser(): Promise<User> {
+    const data = await takeBootstrap('user')
+    if (data) return data.user
     const res = await fetchWithRefresh(`${API_URL}/user/me`)
     if (!res.ok) throw new Error('Failed to fetch user')
     return res.json();
@@ -56,6 +88,8 @@ export const api = {
   },
 
   async getUserThreads(): Promise<ThreadResponse[]> {
+    const data = await takeBootstrap('threads')
+    if (data) return data.threads
     const res = await fetchWithRefresh(`${API_URL}/chat/threads`)
     if (!res.ok) throw new Error('Failed to fetch threads')
     return res.json()
@@ -70,6 +104,11 @@ export const api = {
   },
 
   async getThreadMessages(threadId: number) {
+    const data = bootstrapPromise && !bootstrapUsed.has('messages') ? await bootstrapPromise : null
+    if (data && data.thread_id === threadId) {
+      bootstrapUsed.add('messages')
+      return data.messages
+    }
     const res = await fetchWithRefresh(`${API_URL}/chat/threads/${threadId}/messages`)
     if (!res.ok) throw new Error('Failed to fetch messages')
     return res.json()
@@ -95,6 +134,8 @@ export const api = {
   },
 
   async getWebSocketToken(): Promise<{ ws_token: string }> {
+    const data = await takeBootstrap('ws_token')
+    if (data) return { ws_token: data.ws_token }
     const res = await fetch(`${API_URL}/auth/ws-token`, {
       method: 'POST',
       credentials: 'include',
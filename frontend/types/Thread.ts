@@ -2,6 +2,10 @@ interface Thread {
     id: number
     title: string
     created_at: string
+    message_count?: number
+    last_message_at?: string | null
+    last_message_preview?: string | null
+    last_activity_at?: string
 }
 
 export default Thread;
\ No newline at end of file